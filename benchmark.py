@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the Schonzeiten generator
+Times parsing/filtering, CSV/JSON export, PDF layout and the image download pipeline on
+synthetic data scaled from data/fish_data.json; results are stored per commit for comparison
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import statistics
+import contextlib
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+from PIL import Image
+
+import generate
+
+
+RESULTS_DIR = "benchmarks/results"
+DEFAULT_SIZES = "80,10000,100000"
+DEFAULT_PDF_SIZES = "80,400"
+DEFAULT_FONT = "/System/Library/Fonts/Supplemental/Arial Unicode.ttf"
+
+
+def synthetic_entries(source_entries, count):
+    """Scale the real dataset to count entries, keeping the answer text distribution"""
+    entries = []
+    for i in range(count):
+        entry = source_entries[i % len(source_entries)]
+        suffix = "" if i < len(source_entries) else f" #{i // len(source_entries)}"
+        entries.append({"question": entry["question"] + suffix, "answer": entry["answer"]})
+    return entries
+
+
+def synthetic_jpeg(width, height, seed):
+    """JPEG bytes of a smooth random image, roughly as compressible as a photo"""
+    rng = np.random.default_rng(seed)
+    small = (rng.random((height // 50 + 2, width // 50 + 2, 3)) * 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(small).resize((width, height), Image.BICUBIC).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class ImageServer:
+    """Local stand-in for image hosts: serves synthetic JPEGs with configurable latency"""
+
+    def __init__(self, images, latency=0.0):
+        self.images = images  # path -> bytes
+        self.latency = latency
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(server.latency)
+                data = server.images.get(self.path)
+                if data is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+class FakeSearchProvider:
+    """Deterministic search results pointing at the ImageServer, with configurable latency"""
+
+    def __init__(self, server, results_per_query=10, latency=0.0):
+        self.server = server
+        self.results_per_query = results_per_query
+        self.latency = latency
+        self.paths = sorted(server.images)
+
+    def __call__(self, query):
+        time.sleep(self.latency)
+        rng = random.Random(query)
+        return [{"image": self.server.url + rng.choice(self.paths)} for _ in range(self.results_per_query)]
+
+
+def measure(func, repeat):
+    """Run func repeat times; returns timing stats in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        timings.append(time.perf_counter() - start)
+    return {"min": min(timings), "median": statistics.median(timings), "repeat": repeat}
+
+
+def bench_dataset(results, source_entries, sizes, repeat):
+    for size in sizes:
+        entries = synthetic_entries(source_entries, size)
+        results[f"parse[{size}]"] = measure(lambda: generate.FishDataset.from_entries(entries), repeat)
+
+        dataset = generate.FishDataset.from_entries(entries)
+        generator = generate.FishGenerator(dataset=dataset)
+        results[f"filter[{size}]"] = measure(lambda: [generator.select_fish(name) for name in generate.SELECTIONS],
+                                             repeat)
+        results[f"filter_region[{size}]"] = measure(
+            lambda: [dataset.select(status=status, region=code) for status in generate.SELECTIONS.values()
+                     for code in generate.REGION_CODES], repeat)
+        results[f"csv[{size}]"] = measure(lambda: generator.generate_csv(filename="bench.csv", force=True), repeat)
+        results[f"json[{size}]"] = measure(
+            lambda: generator.generate_repetico_json(filename="bench.json", force=True), repeat)
+        print(f"  Datensatz {size}: fertig", file=sys.stderr)
+
+
+def bench_pdf(results, source_entries, sizes, repeat, font_path, image_size):
+    if not os.path.exists(font_path):
+        print(f"  PDF übersprungen: Schrift {font_path} nicht gefunden (--font)", file=sys.stderr)
+        return
+
+    for size in sizes:
+        entries = synthetic_entries(source_entries, size)
+        generator = generate.FishGenerator(dataset=generate.FishDataset.from_entries(entries))
+        generator.pdf_layout["font_path"] = font_path
+
+        # One realistic image per species, stored through the asset store
+        with contextlib.redirect_stdout(io.StringIO()):
+            for record in generator.fish_data:
+                if generator.image_path(record.question) is None:
+                    data = synthetic_jpeg(*image_size, seed=record.id)
+                    generator.store.add_image(record.question, data)
+
+        pages = 2 * -(-size // 8)
+        # In-process layout, and sharded over all cores where the deck is large enough
+        for workers in sorted({1, os.cpu_count() or 1}):
+            generator.pdf_workers = workers
+            stats = measure(lambda: generator.generate_pdf(filename="bench.pdf", force=True, fetch=False), repeat)
+            stats["per_page"] = stats["median"] / pages
+            results[f"pdf[{size}]" if workers == 1 else f"pdf[{size}, {workers} Prozesse]"] = stats
+        print(f"  PDF {size}: {pages} Seiten", file=sys.stderr)
+
+
+def bench_fetch(results, species, repeat, latency, image_size):
+    images = {f"/img{i}.jpg": synthetic_jpeg(*image_size, seed=1000 + i) for i in range(species * 10)}
+    # Add a few too-small candidates so the early-abort path is exercised too
+    images.update({f"/small{i}.jpg": synthetic_jpeg(320, 200, seed=i) for i in range(species)})
+    server = ImageServer(images, latency=latency)
+    provider = FakeSearchProvider(server, latency=latency)
+
+    def run():
+        generator = generate.FishGenerator(host_interval=0, search_interval=0, search_provider=provider,
+                                           dataset=generate.FishDataset.from_entries(source[:species]))
+        generator.store_db = f"fetch_{time.perf_counter_ns()}.sqlite"
+        generator.cache_dir = f"fetch_cache_{time.perf_counter_ns()}"
+        generator.download_images_for_fish(generator.fish_data)
+
+    try:
+        source = [{"question": f"Fisch {i}", "answer": "Keine Schonzeit, kein Mindestmaß, Einzugsgebiet: D."}
+                  for i in range(species)]
+        results[f"fetch[{species} Arten, {latency * 1000:.0f}ms]"] = measure(run, repeat)
+    finally:
+        server.close()
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current, baseline):
+    print(f"\n{'Benchmark':40} {'vorher':>10} {'jetzt':>10} {'Faktor':>8}")
+    for name, stats in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            print(f"{name:40} {'-':>10} {stats['median']:10.4f} {'neu':>8}")
+            continue
+        ratio = stats["median"] / old["median"] if old["median"] else float("inf")
+        print(f"{name:40} {old['median']:10.4f} {stats['median']:10.4f} {ratio:8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks für den Schonzeiten Generator")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"Datensatzgrößen (Standard: {DEFAULT_SIZES})")
+    parser.add_argument("--pdf-sizes", default=DEFAULT_PDF_SIZES, help=f"Karten pro PDF (Standard: {DEFAULT_PDF_SIZES})")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--font", default=DEFAULT_FONT, help=f"TTF-Schrift für PDF (Standard: {DEFAULT_FONT})")
+    parser.add_argument("--image-size", default="2000x1333", help="Größe der synthetischen Bilder")
+    parser.add_argument("--fetch-species", type=int, default=8, help="Arten im Download-Benchmark (0 = aus)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latenz von Suche und Bildserver in Sekunden")
+    parser.add_argument("--compare", help="Ergebnisdatei (oder Commit) zum Vergleich")
+    parser.add_argument("--output", help=f"Ergebnisdatei (Standard: {RESULTS_DIR}/<commit>.json)")
+    args = parser.parse_args()
+
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(repo_dir, "data", "fish_data.json"), encoding="utf-8") as f:
+        source_entries = json.load(f)
+    image_size = tuple(int(v) for v in args.image_size.split("x"))
+    font_path = os.path.abspath(args.font)
+    revision = git_revision()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        # The generator uses paths relative to the working directory
+        os.chdir(work_dir)
+        print("Datensätze...", file=sys.stderr)
+        bench_dataset(results, source_entries, [int(v) for v in args.sizes.split(",")], args.repeat)
+        print("PDF...", file=sys.stderr)
+        bench_pdf(results, source_entries, [int(v) for v in args.pdf_sizes.split(",")], args.repeat,
+                  font_path, image_size)
+        if args.fetch_species:
+            print("Download-Pipeline...", file=sys.stderr)
+            bench_fetch(results, args.fetch_species, args.repeat, args.latency, image_size)
+        os.chdir(repo_dir)
+
+    report = {
+        "revision": revision,
+        "generator_version": generate.GENERATOR_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+
+    output = args.output or os.path.join(repo_dir, RESULTS_DIR, f"{revision}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    generate.write_json_atomic(output, report)
+
+    print(f"\n{'Benchmark':40} {'min (s)':>10} {'median (s)':>11}")
+    for name, stats in results.items():
+        print(f"{name:40} {stats['min']:10.4f} {stats['median']:11.4f}")
+    print(f"\n💾 Ergebnisse gespeichert: {output}")
+
+    if args.compare:
+        baseline_file = args.compare
+        if not os.path.exists(baseline_file):
+            baseline_file = os.path.join(repo_dir, RESULTS_DIR, f"{args.compare}.json")
+        with open(baseline_file, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
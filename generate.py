@@ -6,241 +6,1825 @@ Generates various formats (PDF, CSV, JSON) for Bavarian fish regulation study ma
 
 import os
 import json
-import requests
 import time
 import hashlib
-import random
 import re
-from fpdf import FPDF
-from PIL import Image
-from io import BytesIO
-from ddgs import DDGS
-from PIL import ImageChops, ImageStat
+import csv
+import sqlite3
+import calendar
+import sys
+import argparse
+import contextlib
+import threading
+import html
+import tempfile
+import zipfile
+import pickle
+import importlib
+import itertools
+from datetime import date, timedelta
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from urllib.parse import urlparse, parse_qs, unquote
+from collections import OrderedDict
+from io import BytesIO, StringIO
 
 
-class FishGenerator:
+class LazyModule:
+    """Module proxy that imports on first attribute access, so text-only runs never load heavy dependencies"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+# Heavy dependencies; fpdf and ddgs are imported where they are used
+np = LazyModule("numpy")
+Image = LazyModule("PIL.Image")
+requests = LazyModule("requests")
+
+
+# Bump whenever output formats change so incremental builds rebuild everything
+GENERATOR_VERSION = "3"
+# Bump whenever FishRecord parsing or the FishDataset indexes change so pickled dataset snapshots are rebuilt
+SNAPSHOT_VERSION = "2"
+
+# Candidate image limits
+MIN_IMAGE_WIDTH = 500
+MIN_IMAGE_HEIGHT = 300
+MAX_IMAGE_BYTES = 15 * 1024 * 1024  # hard cap per candidate body
+MAX_HEADER_BYTES = 256 * 1024  # give up if PIL cannot identify the format within this prefix
+CHUNK_SIZE = 16 * 1024
+
+# Search/HTTP cache: entries older than this are refreshed when online
+CACHE_TTL = 7 * 24 * 3600
+
+# Image quality scoring: analysis size (card aspect 3:2) and flag threshold for weak library images
+QUALITY_ANALYSIS_SIZE = (192, 128)
+QUALITY_FLAG_THRESHOLD = 0.5
+CARD_ASPECT = 90 / 60
+
+# File extensions of stored images by PIL format; other formats use the lower-cased format name
+IMAGE_EXTENSIONS = {"JPEG": "jpg", "MPO": "jpg", "PNG": "png", "GIF": "gif", "WEBP": "webp"}
+
+# Near-duplicate detection: Hamming distance (of 64 bits) below which two images count as the same photo
+NEAR_DUPLICATE_DISTANCE = 6
+
+
+class CandidateRejected(Exception):
+    """Raised when a candidate image is rejected before it is fully downloaded"""
+
+    @property
+    def reason(self):
+        """Message without the per-candidate details, usable as a metric label"""
+        return str(self).split(" (")[0]
+
+
+class SearchCache:
+    """Persistent cache of search results and candidate downloads (SQLite index, image bytes as files)"""
+
+    def __init__(self, cache_dir, ttl=CACHE_TTL):
+        self.cache_dir = cache_dir
+        self.blob_dir = f"{cache_dir}/http"
+        self.ttl = ttl
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(f"{cache_dir}/search_cache.sqlite", check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS searches (
+                query TEXT PRIMARY KEY, results TEXT NOT NULL, fetched_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS downloads (
+                url TEXT PRIMARY KEY, blob TEXT, rejected TEXT, fetched_at REAL NOT NULL);
+        """)
+
+    def _fresh(self, fetched_at, allow_stale):
+        return allow_stale or time.time() - fetched_at < self.ttl
+
+    def get_search(self, query, allow_stale=False):
+        """Cached result list for a query, or None"""
+        with self._lock:
+            row = self._db.execute("SELECT results, fetched_at FROM searches WHERE query = ?", (query,)).fetchone()
+        if row and self._fresh(row[1], allow_stale):
+            return json.loads(row[0])
+        return None
+
+    def put_search(self, query, results):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO searches VALUES (?, ?, ?)",
+                             (query, json.dumps(results, ensure_ascii=False), time.time()))
+
+    def get_download(self, url, allow_stale=False):
+        """(bytes, None) for a cached image, (None, reason) for a cached rejection, or None"""
+        with self._lock:
+            row = self._db.execute("SELECT blob, rejected, fetched_at FROM downloads WHERE url = ?", (url,)).fetchone()
+        if not row or not self._fresh(row[2], allow_stale):
+            return None
+        if row[1] is not None:
+            return None, row[1]
+        try:
+            with open(f"{self.blob_dir}/{row[0]}", "rb") as f:
+                return f.read(), None
+        except OSError:
+            return None
+
+    def put_download(self, url, data):
+        blob = hashlib.sha256(data).hexdigest()
+        blob_path = f"{self.blob_dir}/{blob}"
+        if not os.path.exists(blob_path):
+            tmp_path = f"{blob_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, blob_path)
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO downloads VALUES (?, ?, NULL, ?)", (url, blob, time.time()))
+
+    def put_rejection(self, url, reason):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO downloads VALUES (?, NULL, ?, ?)", (url, reason, time.time()))
+
+    def prune(self):
+        """Drop expired entries and the blobs no entry refers to any more; returns the number of removed blobs.
+        Must not run while downloads are being stored (a fresh blob is written before its row)"""
+        with self._lock, self._db:
+            cutoff = time.time() - self.ttl
+            self._db.execute("DELETE FROM searches WHERE fetched_at < ?", (cutoff,))
+            self._db.execute("DELETE FROM downloads WHERE fetched_at < ?", (cutoff,))
+            referenced = {row[0] for row in self._db.execute("SELECT blob FROM downloads WHERE blob IS NOT NULL")}
+        removed = 0
+        for name in os.listdir(self.blob_dir):
+            if name not in referenced:
+                os.remove(f"{self.blob_dir}/{name}")
+                removed += 1
+        return removed
+
+
+class RateLimiter:
+    """Thread-safe minimum interval between requests sharing the same key (host or provider)"""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, key):
+        """Block until the next request slot for key is available"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(key, now))
+            self._next_slot[key] = slot + self.min_interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Metrics:
+    """Thread-safe stage timings and counters; exported as JSON lines and Prometheus text"""
+
+    def __init__(self, trace=False):
+        self._lock = threading.Lock()
+        self.counters = {}  # (name, labels) -> value
+        self.timings = {}  # (stage, labels) -> [count, total seconds, max seconds]
+        self.events = [] if trace else None  # individual spans, only kept when tracing
+
+    @staticmethod
+    def _labels(labels):
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def count(self, name, value=1, **labels):
+        """Add value to a counter"""
+        key = (name, self._labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, stage, seconds, labels=None, started=None, error=None):
+        """Record one timed run of a stage"""
+        key = (stage, self._labels(labels or {}))
+        with self._lock:
+            timing = self.timings.setdefault(key, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+            if self.events is not None:
+                self.events.append({"type": "span", "stage": stage, "labels": dict(key[1]),
+                                    "start": started, "seconds": round(seconds, 6),
+                                    "thread": threading.current_thread().name, "error": error})
+
+    @contextlib.contextmanager
+    def span(self, stage, **labels):
+        """Time the enclosed block as one run of stage; failures are timed too"""
+        started = time.time()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start, labels, started, error)
+
+    def snapshot(self):
+        """Plain-data copy, e.g. to send from a worker process back to the parent"""
+        with self._lock:
+            return {
+                "counters": [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                "timings": [[stage, dict(labels)] + timing for (stage, labels), timing in self.timings.items()],
+                "events": list(self.events or []),
+            }
+
+    def merge(self, snapshot):
+        """Add a snapshot of another Metrics instance"""
+        for name, labels, value in snapshot["counters"]:
+            self.count(name, value, **labels)
+        with self._lock:
+            for stage, labels, count, total, longest in snapshot["timings"]:
+                timing = self.timings.setdefault((stage, self._labels(labels)), [0, 0.0, 0.0])
+                timing[0] += count
+                timing[1] += total
+                timing[2] = max(timing[2], longest)
+            if self.events is not None:
+                self.events.extend(snapshot["events"])
+
+    def write_jsonl(self, path):
+        """Append this run's spans and aggregates to a JSON lines file"""
+        run = time.strftime("%Y-%m-%dT%H:%M:%S")
+        snapshot = self.snapshot()
+        with open(path, "a", encoding="utf-8") as f:
+            for event in snapshot["events"]:
+                f.write(json.dumps(dict(event, run=run), ensure_ascii=False) + "\n")
+            for name, labels, value in snapshot["counters"]:
+                f.write(json.dumps({"type": "counter", "name": name, "labels": labels, "value": value, "run": run},
+                                   ensure_ascii=False) + "\n")
+            for stage, labels, count, total, longest in snapshot["timings"]:
+                f.write(json.dumps({"type": "stage", "stage": stage, "labels": labels, "count": count,
+                                    "seconds": round(total, 6), "max_seconds": round(longest, 6), "run": run},
+                                   ensure_ascii=False) + "\n")
+
+    def write_prometheus(self, path, prefix="fishgen"):
+        """Write counters and stage timings in the Prometheus text format (atomically, for textfile collectors)"""
+        def series(name, labels):
+            if not labels:
+                return name
+            pairs = []
+            for key, value in labels:
+                value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+                pairs.append(f'{key}="{value}"')
+            return f"{name}{{{','.join(pairs)}}}"
+
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                metric = f"{prefix}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                for (other, labels), value in sorted(self.counters.items()):
+                    if other == name:
+                        lines.append(f"{series(metric, labels)} {value}")
+            timings = sorted(self.timings.items())
+
+        metric = f"{prefix}_stage_seconds"
+        lines.append(f"# TYPE {metric} summary")
+        for (stage, labels), (count, total, _) in timings:
+            labels = (("stage", stage),) + labels
+            lines.append(f"{series(metric + '_sum', labels)} {total:.6f}")
+            lines.append(f"{series(metric + '_count', labels)} {count}")
+        lines.append(f"# TYPE {metric}_max gauge")
+        for (stage, labels), (_, _, longest) in timings:
+            lines.append(f"{series(metric + '_max', (('stage', stage),) + labels)} {longest:.6f}")
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+    def report(self, file=None):
+        """Print stage timings (slowest first) and counters"""
+        with self._lock:
+            timings = sorted(self.timings.items(), key=lambda item: -item[1][1])
+            counters = sorted(self.counters.items())
+        print("\n⏱️ Zeiten je Phase:", file=file)
+        for (stage, labels), (count, total, longest) in timings:
+            name = stage + "".join(f" {key}={value}" for key, value in labels)
+            print(f"  {name:32} {count:7}x  {total:9.3f}s  Ø {total / count:.4f}s  max {longest:.4f}s", file=file)
+        for (name, labels), value in counters:
+            name += "".join(f" {key}={value}" for key, value in labels)
+            print(f"  {name:32} {value}", file=file)
+
+
+# Parsing of the free-text "answer" field, compiled once
+SCHONZEIT_RE = re.compile(r"Schonzeit:\s*([^,]*)")
+MINDESTMASS_RE = re.compile(r"Mindestmaß:\s*([^,]*)")
+DATE_RANGE_RE = re.compile(r"(\d{1,2})\.(\d{1,2})\.?\s*[–-]\s*(\d{1,2})\.(\d{1,2})\.?")
+NORMALIZE_RANGE_RE = re.compile(r"(\d{2}\.\d{2})[–-](\d{2}\.\d{2})")
+SIZE_CM_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*cm")
+REGION_RE = re.compile(r"Einzugsgebiet:\s*([A-Z](?:\s*/\s*[A-Z])*)")
+YEAR_ROUND_MARKER = "Ganzjährig geschont"
+
+# Einzugsgebiete (catchment areas): Donau, Elbe, Rhein, Weser
+REGION_CODES = ("D", "E", "R", "W")
+REGION_BITS = {code: 1 << i for i, code in enumerate(REGION_CODES)}
+
+# Selection status of a record
+STATUS_GANZJAEHRIG = "ganzjaehrig_geschont"
+STATUS_SCHONZEIT = "schonzeit_mindestmass"
+STATUS_NONE = "keine"
+
+# Named selections (output file prefix -> status filter) and output formats
+SELECTIONS = {
+    "alle_fische": None,
+    "ganzjaehrig_geschont": STATUS_GANZJAEHRIG,
+    "schonzeit_mindestmass": STATUS_SCHONZEIT,
+}
+FORMATS = {
+    "pdf": ("generate_pdf", "{selection}_karteikarten.pdf"),
+    "csv": ("generate_csv", "{selection}_repetico.csv"),
+    "json": ("generate_repetico_json", "{selection}_repetico.json"),
+    "apkg": ("generate_apkg", "{selection}_anki.apkg"),
+}
+# Formats that embed fish images (missing ones are fetched before a batch build)
+IMAGE_FORMATS = ("pdf", "apkg")
+# Formats that can be written from a record stream (the PDF layout needs the whole selection)
+STREAM_FORMATS = ("csv", "json")
+
+
+def normalize_schonzeit(text):
+    """Normalize German date format for Schonzeit"""
+    match = NORMALIZE_RANGE_RE.search(text)
+    if match:
+        return f"{match.group(1)} bis {match.group(2)}"
+    return text.strip().rstrip(".")
+
+
+def ics_escape(text):
+    """Escape text for an iCalendar property value"""
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def ics_fold(line, limit=75):
+    """Fold an iCalendar content line to at most 75 octets per physical line"""
+    parts = []
+    current = ""
+    for char in line:
+        if len((current + char).encode("utf-8")) > limit:
+            parts.append(current)
+            current = " " + char
+        else:
+            current += char
+    parts.append(current)
+    return "\r\n".join(parts)
+
+
+class FishRecord:
+    """One parsed fish entry with structured regulation fields"""
+
+    __slots__ = ("id", "question", "answer", "schonzeit", "closed_seasons", "mindestmass",
+                 "min_size_cm", "year_round", "region_mask", "status")
+
+    def __init__(self, record_id, question, answer):
+        self.id = record_id
+        self.question = question
+        self.answer = answer
+        self.year_round = YEAR_ROUND_MARKER in answer
+        
+        # Schonzeit: display text plus ((start_month, start_day), (end_month, end_day)) ranges
+        match = SCHONZEIT_RE.search(answer)
+        raw_schonzeit = match.group(1).strip() if match else ""
+        self.schonzeit = normalize_schonzeit(raw_schonzeit) if match else ""
+        self.closed_seasons = tuple(
+            ((int(m1), int(d1)), (int(m2), int(d2)))
+            for d1, m1, d2, m2 in DATE_RANGE_RE.findall(raw_schonzeit)
+        )
+        
+        match = MINDESTMASS_RE.search(answer)
+        self.mindestmass = match.group(1).strip() if match else ""
+        size = SIZE_CM_RE.search(self.mindestmass)
+        self.min_size_cm = float(size.group(1).replace(",", ".")) if size else None
+        
+        match = REGION_RE.search(answer)
+        codes = match.group(1).replace(" ", "").split("/") if match else []
+        self.region_mask = 0
+        for code in codes:
+            self.region_mask |= REGION_BITS.get(code, 0)
+        
+        if self.year_round:
+            self.status = STATUS_GANZJAEHRIG
+        elif "Schonzeit:" in answer or "Mindestmaß:" in answer:
+            self.status = STATUS_SCHONZEIT
+        else:
+            self.status = STATUS_NONE
+
+    def __repr__(self):
+        return f"FishRecord({self.question!r}, status={self.status!r})"
+
+
+class FishDataset:
+    """Parsed fish records with precomputed selection indexes"""
+
+    def __init__(self, records):
+        self.records = records
+        self.by_name = {record.question: record for record in records}
+        # Sorted record ids per status and per Einzugsgebiet code
+        self.status_index = {STATUS_GANZJAEHRIG: [], STATUS_SCHONZEIT: [], STATUS_NONE: []}
+        self.region_index = {code: [] for code in REGION_CODES}
+        for record in records:
+            self.status_index[record.status].append(record.id)
+            for code in REGION_CODES:
+                if record.region_mask & REGION_BITS[code]:
+                    self.region_index[code].append(record.id)
+
+    @classmethod
+    def from_entries(cls, entries):
+        return cls([FishRecord(i, entry["question"], entry["answer"]) for i, entry in enumerate(entries)])
+
+    @classmethod
+    def load(cls, path, snapshot_path=None):
+        """Parse a data file; with snapshot_path, reuse a pickled parse of byte-identical file content"""
+        if snapshot_path is None:
+            return cls.from_entries(iter_entries(path))
+
+        digest = hashlib.sha256(SNAPSHOT_VERSION.encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        key = digest.hexdigest()
+        
+        try:
+            with open(snapshot_path, "rb") as f:
+                snapshot = pickle.load(f)
+            if snapshot["key"] == key:
+                return snapshot["dataset"]
+        except Exception:
+            pass  # missing, stale or unreadable snapshots are simply rebuilt
+        
+        dataset = cls.from_entries(iter_entries(path))
+        os.makedirs(os.path.dirname(snapshot_path) or ".", exist_ok=True)
+        tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"key": key, "dataset": dataset}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, snapshot_path)
+        return dataset
+
+    def select(self, status=None, region=None):
+        """Return records matching a status and/or Einzugsgebiet code, in dataset order"""
+        if status is None and region is None:
+            return list(self.records)
+        if region is None:
+            return [self.records[i] for i in self.status_index[status]]
+        if status is None:
+            return [self.records[i] for i in self.region_index[region]]
+        # Walk the shorter id list and test the other criterion on the record itself
+        status_ids, region_ids = self.status_index[status], self.region_index[region]
+        if len(status_ids) <= len(region_ids):
+            region_bit = REGION_BITS[region]
+            return [self.records[i] for i in status_ids if self.records[i].region_mask & region_bit]
+        return [self.records[i] for i in region_ids if self.records[i].status == status]
+
+
+def iter_entries(path):
+    """Yield raw entries from a JSON array file, or lazily line by line from a JSON Lines file (.jsonl)"""
+    with open(path, encoding="utf-8") as f:
+        if not path.endswith(".jsonl"):
+            yield from json.load(f)
+            return
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: {e}") from None
+
+
+def iter_records(path):
+    """Parsed records of a data file, one at a time"""
+    for i, entry in enumerate(iter_entries(path)):
+        yield FishRecord(i, entry["question"], entry["answer"])
+
+
+def filter_records(records, status=None, region=None):
+    """Lazy counterpart of FishDataset.select for record streams"""
+    region_bit = REGION_BITS[region] if region is not None else 0
+    for record in records:
+        if status is not None and record.status != status:
+            continue
+        if region is not None and not record.region_mask & region_bit:
+            continue
+        yield record
+
+
+def hash_records(records, digest):
+    """Pass records through while adding them to a content hash (the "records" input of a manifest)"""
+    for record in records:
+        digest.update(f"{record.question}\0{record.answer}\0".encode("utf-8"))
+        yield record
+
+
+# Day-of-year indexing uses a leap reference year so 29.02. has its own row
+CALENDAR_REFERENCE_YEAR = 2000
+DAYS_IN_REFERENCE_YEAR = 366
+MONTH_OFFSETS = tuple(itertools.accumulate(
+    [0] + [calendar.monthrange(CALENDAR_REFERENCE_YEAR, m)[1] for m in range(1, 12)]))
+
+
+def day_index(month, day):
+    """Row of a (month, day) pair in the 366-day closed-season matrix"""
+    return MONTH_OFFSETS[month - 1] + day - 1
+
+
+def day_indices(dates):
+    """Vectorized day_index for an array-like of dates / numpy datetime64 values"""
+    days = np.asarray(dates, dtype="datetime64[D]")
+    months = days.astype("datetime64[M]")
+    month_numbers = months.astype(int) % 12
+    return np.asarray(MONTH_OFFSETS)[month_numbers] + (days - months).astype(int)
+
+
+def index_to_month_day(index):
+    reference = date(CALENDAR_REFERENCE_YEAR, 1, 1) + timedelta(days=int(index))
+    return reference.month, reference.day
+
+
+def safe_date(year, month, day):
+    """date() that maps 29.02. to 28.02. in non-leap years"""
+    return date(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+
+class SchonzeitCalendar:
+    """Day-of-year interval index over all closed seasons (366 x N boolean matrix)"""
+
+    def __init__(self, dataset):
+        self.records = dataset.records
+        count = len(self.records)
+        self.closed = np.zeros((DAYS_IN_REFERENCE_YEAR, count), dtype=bool)
+        self.year_round = np.zeros(count, dtype=bool)
+        self.region_masks = np.zeros(count, dtype=np.uint8)
+        
+        for record in self.records:
+            self.year_round[record.id] = record.year_round
+            self.region_masks[record.id] = record.region_mask
+            for (start_month, start_day), (end_month, end_day) in record.closed_seasons:
+                start = day_index(start_month, start_day)
+                end = day_index(end_month, end_day)
+                if start <= end:
+                    self.closed[start:end + 1, record.id] = True
+                else:
+                    # Range wraps across New Year, e.g. 01.10.–15.03.
+                    self.closed[start:, record.id] = True
+                    self.closed[:end + 1, record.id] = True
+
+    def _columns(self, region=None, include_year_round=True):
+        """Boolean column filter and per-column year-round override"""
+        columns = np.ones(len(self.records), dtype=bool)
+        if region is not None:
+            columns &= (self.region_masks & REGION_BITS[region]) != 0
+        override = self.year_round if include_year_round else np.zeros_like(self.year_round)
+        return columns, override
+
+    def closed_matrix(self, dates, region=None, include_year_round=True):
+        """Boolean matrix (len(dates) x N): is fish N closed on each date"""
+        columns, override = self._columns(region, include_year_round)
+        rows = self.closed[day_indices(dates)] | override
+        return rows & columns
+
+    def closed_on(self, day, region=None, include_year_round=True):
+        """Records that may not be caught on a date (optionally within one Einzugsgebiet)"""
+        row = self.closed_matrix([day], region, include_year_round)[0]
+        return [self.records[i] for i in np.flatnonzero(row)]
+
+    def year_matrix(self, year, region=None, include_year_round=True):
+        """All dates of a year and the matching closed matrix"""
+        dates = np.arange(f"{year}-01-01", f"{year + 1}-01-01", dtype="datetime64[D]")
+        return dates, self.closed_matrix(dates, region, include_year_round)
+
+    def season_opens(self, record, day):
+        """First date on or after day on which the fish is not closed; None if protected year-round"""
+        if record.year_round:
+            return None
+        dates = np.arange(np.datetime64(day), np.datetime64(day) + DAYS_IN_REFERENCE_YEAR + 1)
+        column = self.closed[day_indices(dates), record.id]
+        open_days = np.flatnonzero(~column)
+        if len(open_days) == 0:
+            return None
+        return day + timedelta(days=int(open_days[0]))
+
+    def closed_ranges(self, record):
+        """Closed runs of a record as ((start_month, start_day), (end_month, end_day)), read from the index"""
+        column = self.closed[:, record.id]
+        if column.all() or not column.any():
+            return []
+        # Rotate so the column starts on an open day; wrapped runs then become contiguous
+        shift = int(np.flatnonzero(~column)[0])
+        rotated = np.roll(column, -shift).astype(np.int8)
+        edges = np.diff(np.concatenate(([0], rotated, [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1) - 1
+        return [
+            (index_to_month_day((start + shift) % DAYS_IN_REFERENCE_YEAR),
+             index_to_month_day((end + shift) % DAYS_IN_REFERENCE_YEAR))
+            for start, end in zip(starts, ends)
+        ]
+
+
+def write_json_atomic(path, data):
+    """Write JSON via a temporary file so readers never see a half-written file"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, path)
+
+
+def dhash(img, hash_size=8):
+    """64-bit difference hash: sign of horizontal gradients on a tiny grayscale thumbnail"""
+    thumb = img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = np.asarray(thumb, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a, b):
+    """Number of differing bits between two hashes"""
+    return (a ^ b).bit_count()
+
+
+def score_images(images, aspect_ratios=None):
+    """Score a batch of images in one vectorized pass; returns a dict of per-image arrays in [0, 1]
+
+    Components: sharpness (Laplacian variance), exposure, contrast, colorfulness,
+    fit of the original aspect ratio to the card, and a penalty for text/watermark-heavy images.
+    """
+    if aspect_ratios is None:
+        aspect_ratios = [img.width / img.height for img in images]
+    batch = np.stack([
+        np.asarray(img.convert("RGB").resize(QUALITY_ANALYSIS_SIZE, Image.BILINEAR), dtype=np.float32)
+        for img in images
+    ]) / 255.0  # (N, H, W, 3)
+    red, green, blue = batch[..., 0], batch[..., 1], batch[..., 2]
+    gray = 0.299 * red + 0.587 * green + 0.114 * blue
+    
+    # Sharpness: variance of the 4-neighbour Laplacian, log-scaled
+    laplacian = (gray[:, :-2, 1:-1] + gray[:, 2:, 1:-1] + gray[:, 1:-1, :-2] + gray[:, 1:-1, 2:]
+                 - 4 * gray[:, 1:-1, 1:-1])
+    sharpness = np.clip(np.log1p(laplacian.var(axis=(1, 2)) * 1e4) / np.log1p(100.0), 0, 1)
+    
+    # Exposure: mean brightness near the middle, few clipped pixels
+    mean = gray.mean(axis=(1, 2))
+    clipped = ((gray < 0.02) | (gray > 0.98)).mean(axis=(1, 2))
+    exposure = np.clip(1 - 2 * np.abs(mean - 0.5) - clipped, 0, 1)
+    
+    contrast = np.clip(gray.std(axis=(1, 2)) / 0.25, 0, 1)
+    
+    # Colorfulness (Hasler & Süsstrunk) on the 0..255 scale
+    rg = (red - green) * 255
+    yb = (0.5 * (red + green) - blue) * 255
+    colorfulness_raw = (np.sqrt(rg.std(axis=(1, 2)) ** 2 + yb.std(axis=(1, 2)) ** 2)
+                        + 0.3 * np.sqrt(rg.mean(axis=(1, 2)) ** 2 + yb.mean(axis=(1, 2)) ** 2))
+    colorfulness = np.clip(colorfulness_raw / 100, 0, 1)
+    
+    ratios = np.asarray(aspect_ratios, dtype=np.float32)
+    aspect_fit = np.minimum(ratios / CARD_ASPECT, CARD_ASPECT / ratios)
+    
+    # Text/watermark heuristic: lettering makes dense, strong edges in horizontal bands
+    # (captions, banners); photos of fish have their edges spread over the frame
+    edges = (np.abs(np.diff(gray, axis=2))[:, :-1, :] + np.abs(np.diff(gray, axis=1))[:, :, :-1]) > 0.25
+    band_density = edges.mean(axis=2)  # (N, H-1): strong-edge share per row
+    text_penalty = np.clip((np.percentile(band_density, 95, axis=1) - 0.12) / 0.2, 0, 1)
+    
+    score = (0.30 * sharpness + 0.15 * exposure + 0.15 * contrast + 0.10 * colorfulness
+             + 0.30 * aspect_fit - 0.25 * text_penalty)
+    return {
+        "score": np.clip(score, 0, 1),
+        "sharpness": sharpness,
+        "exposure": exposure,
+        "contrast": contrast,
+        "colorfulness": colorfulness,
+        "aspect_fit": aspect_fit,
+        "text_penalty": text_penalty,
+    }
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance for sub-linear near-duplicate lookup"""
+
     def __init__(self):
+        self.root = None  # node: [hash, set of names, {distance: child node}]
+
+    def add(self, value, name):
+        if self.root is None:
+            self.root = [value, {name}, {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].add(name)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, {name}, {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """Return (distance, hash, name) for all entries within max_distance"""
+        matches = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                matches.extend((distance, node[0], name) for name in node[1])
+            # Triangle inequality: only subtrees within [d - max, d + max] can match
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return sorted(matches)
+
+
+class PerceptualIndex:
+    """In-memory dHash lookup over the current image of every species, keyed by fish name"""
+
+    def __init__(self, entries):
+        self.entries = dict(entries)  # name -> 64-bit dHash
+        self.tree = BKTree()
+        self._lock = threading.Lock()
+        for name, value in self.entries.items():
+            self.tree.add(value, name)
+
+    def find(self, value, max_distance=NEAR_DUPLICATE_DISTANCE):
+        """Return (distance, name) of library images that look like the given hash"""
+        with self._lock:
+            # Tree nodes are never removed; drop hits whose name now points to a different image
+            return [(distance, name) for distance, node_hash, name in self.tree.search(value, max_distance)
+                    if self.entries.get(name) == node_hash]
+
+    def update(self, name, value):
+        """Record the hash of a species' new image"""
+        with self._lock:
+            self.entries[name] = value
+            self.tree.add(value, name)
+
+
+class AssetStore:
+    """Content-addressed image blobs with an SQLite index of species, assets and quality flags"""
+
+    def __init__(self, root, db_file):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._revision = 0  # bumped on every change made through this store
+        self._db = sqlite3.connect(db_file, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS assets (
+                hash TEXT PRIMARY KEY,      -- SHA-256 of the stored file (the original bytes)
+                path TEXT NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                phash TEXT NOT NULL,        -- 64-bit dHash, hex
+                quality REAL,
+                source_url TEXT,
+                fetched_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS species (
+                name TEXT PRIMARY KEY,
+                asset TEXT REFERENCES assets(hash),
+                poor_quality INTEGER NOT NULL DEFAULT 0,
+                flag_reason TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS species_poor_quality ON species(poor_quality);
+        """)
+
+    def add_image(self, name, data, source_url=None, phash=None, quality=None):
+        """Store image bytes unchanged as the current asset of a species; returns the asset hash"""
+        # PIL only reads the header (and decodes for the dHash when none is given)
+        with Image.open(BytesIO(data)) as img:
+            extension = IMAGE_EXTENSIONS.get(img.format, (img.format or "img").lower())
+            width, height = img.size
+            if phash is None:
+                phash = dhash(img)
+        digest = hashlib.sha256(data).hexdigest()
+        path = f"{self.root}/{digest[:2]}/{digest}.{extension}"
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR IGNORE INTO assets (hash, path, width, height, phash, quality, source_url, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (digest, path, width, height, f"{phash:016x}", quality, source_url, now))
+            self._db.execute(
+                "INSERT INTO species (name, asset, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET asset = excluded.asset, updated_at = excluded.updated_at",
+                (name, digest, now))
+            self._revision += 1
+        return digest
+
+    def current(self, names=None):
+        """name -> asset row (joined with species flags) for species that have an image"""
+        query = ("SELECT species.name, species.poor_quality, species.flag_reason, assets.* "
+                 "FROM species JOIN assets ON assets.hash = species.asset")
+        if names is None:
+            with self._lock:
+                rows = self._db.execute(query).fetchall()
+            return {row["name"]: row for row in rows}
+        
+        # Primary-key lookups, in chunks below SQLite's host parameter limit
+        names = list(dict.fromkeys(names))
+        result = {}
+        with self._lock:
+            for start in range(0, len(names), 500):
+                chunk = names[start:start + 500]
+                rows = self._db.execute(f"{query} WHERE species.name IN ({', '.join('?' * len(chunk))})",
+                                        chunk).fetchall()
+                result.update((row["name"], row) for row in rows)
+        return result
+
+    def image_path(self, name):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT assets.path FROM species JOIN assets ON assets.hash = species.asset WHERE species.name = ?",
+                (name,)).fetchone()
+        return row["path"] if row else None
+
+    def flagged(self):
+        """Names of species marked as poor quality"""
+        with self._lock:
+            rows = self._db.execute("SELECT name FROM species WHERE poor_quality = 1 ORDER BY name").fetchall()
+        return [row["name"] for row in rows]
+
+    def set_flag(self, name, flagged, reason=None):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO species (name, poor_quality, flag_reason, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET poor_quality = excluded.poor_quality, "
+                "flag_reason = excluded.flag_reason, updated_at = excluded.updated_at",
+                (name, int(flagged), reason if flagged else None, time.time()))
+            self._revision += 1
+
+    def set_quality(self, asset_hash, score):
+        with self._lock, self._db:
+            self._db.execute("UPDATE assets SET quality = ? WHERE hash = ?", (score, asset_hash))
+            self._revision += 1
+
+    def revision(self):
+        """Cheap change marker: differs after any change by this store or any other connection to the index"""
+        with self._lock:
+            data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        return self._revision, data_version
+
+    def import_legacy(self, images_dir, poor_quality_file):
+        """One-way migration: name-keyed JPEGs and the flat poor-quality list"""
+        known = set(self.current())
+        if os.path.isdir(images_dir):
+            for filename in sorted(os.listdir(images_dir)):
+                name = filename[:-4]
+                if not filename.lower().endswith(".jpg") or name in known:
+                    continue
+                try:
+                    with open(os.path.join(images_dir, filename), "rb") as f:
+                        self.add_image(name, f.read())
+                    print(f"📥 {name}: Bild in den Bildspeicher übernommen")
+                except Exception as e:
+                    print(f"⚠️ {name}: Bild konnte nicht übernommen werden – {e}")
+        
+        # The text file stays as an inbox: names listed there get flagged, then it is emptied
+        if os.path.exists(poor_quality_file):
+            with open(poor_quality_file, encoding="utf-8") as f:
+                names = [line.strip() for line in f if line.strip()]
+            for name in names:
+                self.set_flag(name, True, "manuell markiert")
+            if names:
+                open(poor_quality_file, "w").close()
+                print(f"📥 Qualitätskontrolle übernommen: {', '.join(names)}")
+
+
+class DownloadQueue:
+    """Persistent per-species download jobs; every state change is committed immediately
+
+    States: pending (due at next_retry_at), in_flight, done, failed (attempts exhausted).
+    Rows stay until every job of a run is done or failed, so an interrupted run resumes;
+    failed rows keep their reason until a later enqueue reopens them.
+    """
+
+    def __init__(self, db_file, max_attempts=3, retry_backoff=10):
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+        self._db = sqlite3.connect(db_file, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS download_jobs (
+                name TEXT PRIMARY KEY,
+                state TEXT NOT NULL DEFAULT 'pending',
+                force INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                next_retry_at REAL NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            );
+        """)
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._db:
+            return self._db.execute(sql, params).fetchall()
+
+    def resume(self):
+        """Reset jobs left in flight by an interrupted run; returns the number of open jobs"""
+        self._execute("UPDATE download_jobs SET state = 'pending', next_retry_at = 0 WHERE state = 'in_flight'")
+        return self._execute("SELECT COUNT(*) FROM download_jobs WHERE state = 'pending'")[0][0]
+
+    def enqueue(self, name, force):
+        """Add a job; a finished job of an interrupted run is reopened, an open one keeps its schedule.
+        force is sticky: a forced request is never downgraded by a resumed unforced job"""
+        self._execute(
+            "INSERT INTO download_jobs (name, force, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET force = MAX(force, excluded.force), "
+            "state = CASE WHEN state IN ('done', 'failed') THEN 'pending' ELSE state END, "
+            "attempts = CASE WHEN state IN ('done', 'failed') THEN 0 ELSE attempts END, "
+            "next_retry_at = CASE WHEN state IN ('done', 'failed') THEN 0 ELSE next_retry_at END, "
+            "updated_at = excluded.updated_at",
+            (name, int(force), time.time()))
+
+    def claim_due(self, limit):
+        """Mark up to limit due jobs as in flight and return (name, force) pairs"""
+        if limit <= 0:
+            return []
+        with self._lock, self._db:
+            rows = self._db.execute(
+                "SELECT name, force FROM download_jobs WHERE state = 'pending' AND next_retry_at <= ? "
+                "ORDER BY next_retry_at, name LIMIT ?", (time.time(), limit)).fetchall()
+            self._db.executemany("UPDATE download_jobs SET state = 'in_flight', updated_at = ? WHERE name = ?",
+                                 [(time.time(), row["name"]) for row in rows])
+        return [(row["name"], bool(row["force"])) for row in rows]
+
+    def next_due(self):
+        """Earliest next_retry_at of pending jobs, or None if nothing is pending"""
+        return self._execute("SELECT MIN(next_retry_at) FROM download_jobs WHERE state = 'pending'")[0][0]
+
+    def complete(self, name):
+        self._execute("UPDATE download_jobs SET state = 'done', last_error = NULL, updated_at = ? WHERE name = ?",
+                      (time.time(), name))
+
+    def fail(self, name, reason, retry=True):
+        """Record a failed attempt; schedules a retry with exponential backoff until attempts run out.
+        Returns the retry delay in seconds, or None if the job failed for good."""
+        with self._lock, self._db:
+            attempts = self._db.execute("SELECT attempts FROM download_jobs WHERE name = ?",
+                                        (name,)).fetchone()["attempts"] + 1
+            delay = self.retry_backoff * 2 ** (attempts - 1) if retry and attempts < self.max_attempts else None
+            self._db.execute(
+                "UPDATE download_jobs SET state = ?, attempts = ?, last_error = ?, next_retry_at = ?, updated_at = ? "
+                "WHERE name = ?",
+                ("pending" if delay is not None else "failed", attempts, reason,
+                 time.time() + (delay or 0), time.time(), name))
+        return delay
+
+    def failed(self, names=None):
+        """Failed job rows (name, attempts, last_error), optionally only for the given names"""
+        rows = self._execute("SELECT name, attempts, last_error FROM download_jobs WHERE state = 'failed' ORDER BY name")
+        wanted = None if names is None else set(names)
+        return [row for row in rows if wanted is None or row["name"] in wanted]
+
+    def clear_finished_run(self):
+        """Drop the done jobs once none is pending or in flight any more"""
+        with self._lock, self._db:
+            open_jobs = self._db.execute(
+                "SELECT COUNT(*) FROM download_jobs WHERE state IN ('pending', 'in_flight')").fetchone()[0]
+            if open_jobs == 0:
+                self._db.execute("DELETE FROM download_jobs WHERE state = 'done'")
+        return open_jobs == 0
+
+
+# Anki collection inside an .apkg package (legacy schema 11, importable by all Anki versions)
+ANKI_SCHEMA = """
+    CREATE TABLE col (
+        id integer PRIMARY KEY, crt integer NOT NULL, mod integer NOT NULL, scm integer NOT NULL,
+        ver integer NOT NULL, dty integer NOT NULL, usn integer NOT NULL, ls integer NOT NULL,
+        conf text NOT NULL, models text NOT NULL, decks text NOT NULL, dconf text NOT NULL, tags text NOT NULL);
+    CREATE TABLE notes (
+        id integer PRIMARY KEY, guid text NOT NULL, mid integer NOT NULL, mod integer NOT NULL,
+        usn integer NOT NULL, tags text NOT NULL, flds text NOT NULL, sfld integer NOT NULL,
+        csum integer NOT NULL, flags integer NOT NULL, data text NOT NULL);
+    CREATE TABLE cards (
+        id integer PRIMARY KEY, nid integer NOT NULL, did integer NOT NULL, ord integer NOT NULL,
+        mod integer NOT NULL, usn integer NOT NULL, type integer NOT NULL, queue integer NOT NULL,
+        due integer NOT NULL, ivl integer NOT NULL, factor integer NOT NULL, reps integer NOT NULL,
+        lapses integer NOT NULL, left integer NOT NULL, odue integer NOT NULL, odid integer NOT NULL,
+        flags integer NOT NULL, data text NOT NULL);
+    CREATE TABLE revlog (
+        id integer PRIMARY KEY, cid integer NOT NULL, usn integer NOT NULL, ease integer NOT NULL,
+        ivl integer NOT NULL, lastIvl integer NOT NULL, factor integer NOT NULL, time integer NOT NULL,
+        type integer NOT NULL);
+    CREATE TABLE graves (usn integer NOT NULL, oid integer NOT NULL, type integer NOT NULL);
+    CREATE INDEX ix_notes_usn ON notes (usn);
+    CREATE INDEX ix_cards_usn ON cards (usn);
+    CREATE INDEX ix_revlog_usn ON revlog (usn);
+    CREATE INDEX ix_cards_nid ON cards (nid);
+    CREATE INDEX ix_cards_sched ON cards (did, queue, due);
+    CREATE INDEX ix_revlog_cid ON revlog (cid);
+    CREATE INDEX ix_notes_csum ON notes (csum);
+"""
+# Fixed, so re-imports update the same note type; a new id whenever the fields change
+ANKI_MODEL_ID = 1719400000002
+# Anki derives the duplicate check from the first field, so the always-present name comes first
+ANKI_FIELDS = ("Name", "Bild", "Antwort")
+ANKI_FRONT = '{{#Bild}}{{Bild}}{{/Bild}}{{^Bild}}<div class="missing">Kein Bild</div>{{/Bild}}'
+ANKI_BACK = '{{FrontSide}}<hr id="answer"><div class="name">{{Name}}</div><div>{{Antwort}}</div>'
+ANKI_CSS = """.card { font-family: Arial, sans-serif; font-size: 20px; text-align: center; }
+.card img { max-width: 100%; max-height: 60vh; }
+.name { font-weight: bold; margin-bottom: 0.5em; }
+.missing { color: #888; padding: 3em 0; }"""
+
+
+def anki_id(text):
+    """Stable 48-bit id derived from a name (deck ids, note guids)"""
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:12], 16)
+
+
+def anki_checksum(text):
+    """Anki's note checksum (csum): first 32 bits of the SHA-1 of the first field, HTML stripped"""
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def anki_collection(deck_id, deck_name, now):
+    """JSON columns (conf, models, decks, dconf) of a collection holding one deck of fish notes"""
+    mod = int(now)
+    model = {
+        "id": ANKI_MODEL_ID, "name": "Fischereischein Bayern – Fischart", "type": 0, "mod": mod, "usn": -1,
+        "sortf": 0, "did": deck_id, "css": ANKI_CSS, "tags": [], "vers": [],
+        "latexPre": "\\documentclass[12pt]{article}\n\\begin{document}\n", "latexPost": "\\end{document}",
+        "latexsvg": False, "req": [[0, "any", [0, 1]]],
+        "flds": [{"name": name, "ord": i, "sticky": False, "rtl": False, "font": "Arial", "size": 20, "media": []}
+                 for i, name in enumerate(ANKI_FIELDS)],
+        "tmpls": [{"name": "Bild → Fischart", "ord": 0, "qfmt": ANKI_FRONT, "afmt": ANKI_BACK,
+                   "did": None, "bqfmt": "", "bafmt": ""}],
+    }
+    deck_defaults = {"mod": mod, "usn": -1, "lrnToday": [0, 0], "revToday": [0, 0], "newToday": [0, 0],
+                     "timeToday": [0, 0], "collapsed": False, "desc": "", "dyn": 0, "conf": 1,
+                     "extendNew": 10, "extendRev": 50}
+    decks = {
+        "1": dict(deck_defaults, id=1, name="Default"),
+        str(deck_id): dict(deck_defaults, id=deck_id, name=deck_name),
+    }
+    dconf = {"1": {
+        "id": 1, "name": "Default", "mod": 0, "usn": 0, "maxTaken": 60, "autoplay": True, "timer": 0,
+        "replayq": True, "dyn": False,
+        "new": {"delays": [1, 10], "ints": [1, 4, 7], "initialFactor": 2500, "order": 1, "perDay": 20,
+                "bury": True, "separate": True},
+        "rev": {"perDay": 100, "ease4": 1.3, "fuzz": 0.05, "ivlFct": 1, "maxIvl": 36500, "minSpace": 1,
+                "bury": True},
+        "lapse": {"delays": [10], "mult": 0, "minInt": 1, "leechFails": 8, "leechAction": 0},
+    }}
+    conf = {"nextPos": 1, "estTimes": True, "activeDecks": [deck_id], "sortType": "noteFld", "timeLim": 0,
+            "sortBackwards": False, "addToCur": True, "curDeck": deck_id, "newBury": True, "newSpread": 0,
+            "dueCounts": True, "curModel": str(ANKI_MODEL_ID), "collapseTime": 1200}
+    return {"conf": conf, "models": {str(ANKI_MODEL_ID): model}, "decks": decks, "dconf": dconf}
+
+
+class FishGenerator:
+    def __init__(self, max_workers=4, candidate_workers=4, host_interval=0.5,
+                 search_interval=2.0, max_attempts=3, retry_backoff=10, dataset=None,
+                 offline=False, search_provider=None, metrics=None):
         self.data_file = "data/fish_data.json"
-        self.images_dir = "images/fish_images"
+        self.images_dir = "images/fish_images"  # legacy name-keyed JPEGs, imported into the store
+        self.store_dir = "images/store"
+        self.store_db = "images/assets.sqlite"
         self.output_dir = "output"
         self.config_dir = "config"
         self.poor_quality_file = f"{self.config_dir}/poor_quality_images.txt"
+        self.manifest_dir = f"{self.output_dir}/.manifest"
+        self.derivatives_dir = "images/derivatives"
+        self.cache_dir = "cache"
+        
+        # PDF layout (mm); part of the build manifest
+        self.pdf_layout = {
+            "font_path": "/System/Library/Fonts/Supplemental/Arial Unicode.ttf",
+            "font_size": 14,
+            "line_height": 7,
+            "card_w": 90,
+            "card_h": 60,
+            "margin_x": 10,
+            "margin_y": 10,
+            "gap": 10,
+            "padding": 2,
+            "image_dpi": 300,  # resolution of the card-sized image derivatives
+            "jpeg_quality": 85,
+        }
+        self.pdf_workers = None  # processes for sharded PDF layout (None = CPU cores, 1 = in-process)
+        self.pdf_shard_min_cards = 400  # smaller decks are laid out in-process
         
-        # Ensure directories exist
-        for dir_path in [self.images_dir, self.output_dir, self.config_dir]:
-            os.makedirs(dir_path, exist_ok=True)
+        # Download engine settings
+        self.max_workers = max_workers  # species downloaded in parallel
+        self.candidate_workers = candidate_workers  # candidate images fetched in parallel per species
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff  # seconds before the first retry, doubled per attempt
+        self.host_limiter = RateLimiter(host_interval)
+        self.search_limiter = RateLimiter(search_interval)
+        self.offline = offline  # replay cached searches and downloads only
+        self.search_provider = search_provider or self.search_ddgs
+        self._search_cache = None
+        self._session = None
+        self._network_lock = threading.Lock()
+        self._phash_index = None
+        self._calendar = None
+        self._phash_lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._store = None
+        self._store_lock = threading.Lock()
+        self._download_queue = None
+        self.metrics = metrics or Metrics()  # stage timings and counters
         
-        # Load fish data
-        with open(self.data_file, encoding="utf-8") as f:
-            self.fish_data = json.load(f)
+        # Fish data is parsed on first use (or an already parsed dataset is reused);
+        # directories are created by the code that writes into them
+        self.dataset_snapshot = f"{self.cache_dir}/dataset.pickle"
+        self._dataset = dataset
+        self._dataset_lock = threading.Lock()
+    
+    @property
+    def dataset(self):
+        """Parsed fish data, loaded on first use from the snapshot while the data file is unchanged"""
+        with self._dataset_lock:
+            if self._dataset is None:
+                self._dataset = FishDataset.load(self.data_file, self.dataset_snapshot)
+            return self._dataset
+    
+    @property
+    def fish_data(self):
+        return self.dataset.records
+    
+    def output_file(self, filename):
+        """Path of an output file; the output directory is created on first use"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        return f"{self.output_dir}/{filename}"
     
     def filter_fish_with_schonzeit(self):
         """Filter fish that have a Schonzeit (closed season) or Mindestmaß"""
-        filtered = []
-        for fish in self.fish_data:
-            answer = fish["answer"]
-            if ("Schonzeit:" in answer or "Mindestmaß:" in answer) and "Ganzjährig geschont" not in answer:
-                filtered.append(fish)
-        return filtered
+        return self.dataset.select(status=STATUS_SCHONZEIT)
     
     def filter_fish_ganzjaehrig_geschont(self):
         """Filter fish that are protected year-round (ganzjährig geschont)"""
-        filtered = []
-        for fish in self.fish_data:
-            answer = fish["answer"]
-            if "Ganzjährig geschont" in answer:
-                filtered.append(fish)
-        return filtered
+        return self.dataset.select(status=STATUS_GANZJAEHRIG)
+    
+    def select_fish(self, selection):
+        """Records of a named selection (see SELECTIONS)"""
+        return self.dataset.select(status=SELECTIONS[selection])
+    
+    @property
+    def calendar(self):
+        """Schonzeit calendar index, built on first use"""
+        if self._calendar is None:
+            self._calendar = SchonzeitCalendar(self.dataset)
+        return self._calendar
+    
+    def fish_closed_on(self, day, region=None):
+        """Fish that may not be caught on a date (Schonzeit or ganzjährig geschont)"""
+        return self.calendar.closed_on(day, region)
+    
+    def season_opens(self, fish_name, day=None):
+        """Date on which fishing for a fish opens again, starting from day (default: today)"""
+        return self.calendar.season_opens(self.dataset.by_name[fish_name], day or date.today())
+    
+    @property
+    def store(self):
+        """Image asset store, opened (and legacy files imported) on first use"""
+        with self._store_lock:
+            if self._store is None:
+                self._store = AssetStore(self.store_dir, self.store_db)
+                self._store.import_legacy(self.images_dir, self.poor_quality_file)
+            return self._store
+    
+    def image_path(self, fish_name):
+        """Path of the current image of a fish, or None"""
+        return self.store.image_path(fish_name)
     
     def load_poor_quality_list(self):
         """Load list of fish names that need image replacement"""
-        if not os.path.exists(self.poor_quality_file):
-            return []
+        return self.store.flagged()
+    
+    @property
+    def phash_index(self):
+        """Perceptual-hash index of the current image of every species, built on first use"""
+        with self._phash_lock:
+            if self._phash_index is None:
+                current = self.store.current()
+                self._phash_index = PerceptualIndex({name: int(row["phash"], 16) for name, row in current.items()})
+            return self._phash_index
+    
+    def fetch_image(self, query, force_alternate=False):
+        """Fetch fish image from DuckDuckGo with quality validation (one attempt; raises if nothing fits)"""
+        if not force_alternate and self.image_path(query):
+            return False  # Image exists and not marked for replacement
         
-        with open(self.poor_quality_file, encoding="utf-8") as f:
-            return [line.strip() for line in f if line.strip()]
+        with self.metrics.span("fetch_image"):
+            phash_index = self.phash_index
+            
+            with self.metrics.span("search"):
+                results = self.search_images(query)
+            
+            # Drop candidates that are already in the library (for this or another species)
+            candidates = []
+            errors = []
+            for url, data, img in self.download_candidates(results, errors):
+                value = dhash(img)
+                matches = phash_index.find(value)
+                if matches:
+                    distance, other = matches[0]
+                    self.metrics.count("candidates_rejected", reason="Duplikat")
+                    if other == query:
+                        print(f"{query}: Zu ähnlich zum vorhandenen Bild (Distanz={distance}) – übersprungen")
+                    else:
+                        print(f"{query}: Bild bereits für {other} verwendet (Distanz={distance}) – übersprungen")
+                    continue
+                candidates.append((url, data, img, value))
+            
+            # Score all candidates together and take the best, not the first acceptable one
+            if candidates:
+                with self.metrics.span("score"):
+                    scores = score_images([img for _, _, img, _ in candidates])["score"]
+                ranked = sorted(range(len(candidates)), key=lambda i: (-scores[i], candidates[i][0]))
+                for i in ranked:
+                    url, data, _, value = candidates[i]
+                    # Re-check and save atomically so parallel species cannot claim the same photo
+                    with self._save_lock, self.metrics.span("save"):
+                        if phash_index.find(value):
+                            continue
+                        self.store.add_image(query, data, source_url=url, phash=value, quality=float(scores[i]))
+                        phash_index.update(query, value)
+                    self.metrics.count("images_saved")
+                    print(f"✅ {query}: Neues Bild gespeichert (Qualität {scores[i]:.2f})")
+                    return True
+            
+            # Rejections are cached, so only transport errors make another attempt worthwhile
+            if errors:
+                raise Exception(f"Kein ausreichendes Bild gefunden ({len(errors)} Downloads fehlgeschlagen).")
+            raise CandidateRejected("Kein ausreichendes Bild gefunden.")
     
-    def save_poor_quality_list(self, fish_list):
-        """Save updated list of fish names that need image replacement"""
-        with open(self.poor_quality_file, "w", encoding="utf-8") as f:
-            for fish_name in fish_list:
-                f.write(fish_name + "\n")
+    @property
+    def search_cache(self):
+        """Search result / download cache, opened on first use"""
+        with self._network_lock:
+            if self._search_cache is None:
+                self._search_cache = SearchCache(self.cache_dir)
+            return self._search_cache
     
-    def image_hash(self, img):
-        """Generate SHA-256 hash of image for duplicate detection"""
-        return hashlib.sha256(img.tobytes()).hexdigest()
+    @property
+    def session(self):
+        """Shared HTTP session so candidate downloads reuse pooled connections"""
+        with self._network_lock:
+            if self._session is None:
+                pool_size = self.max_workers * self.candidate_workers
+                adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                self._session = requests.Session()
+                self._session.mount("http://", adapter)
+                self._session.mount("https://", adapter)
+            return self._session
     
-    def image_diff(self, img1, img2):
-        """Calculate Mean Square Error between two images"""
-        diff = ImageChops.difference(img1, img2)
-        stat = ImageStat.Stat(diff)
-        mse = sum([v**2 for v in stat.mean]) / len(stat.mean)
-        return mse
+    def search_ddgs(self, query):
+        """Search DuckDuckGo for candidate images, rate-limited per search provider"""
+        from ddgs import DDGS
+        
+        with self.metrics.span("rate_limit", key="search"):
+            self.search_limiter.wait("ddgs")
+        with DDGS() as ddgs:
+            return list(ddgs.images(query + " Fisch", max_results=10))
     
-    def fetch_image(self, query, path, force_alternate=False):
-        """Fetch fish image from DuckDuckGo with quality validation"""
-        existing_img = None
-        existing_hash = None
+    def search_images(self, query):
+        """Candidate images for a query, served from the cache when possible"""
+        cached = self.search_cache.get_search(query, allow_stale=self.offline)
+        if cached is not None:
+            self.metrics.count("searches", source="cache")
+            return cached
+        if self.offline:
+            raise CandidateRejected("Offline – keine gespeicherte Suche")
         
-        if os.path.exists(path):
-            try:
-                existing_img = Image.open(path).convert("RGB")
-                existing_hash = self.image_hash(existing_img)
-            except:
-                existing_img = None
-                existing_hash = None
-            if not force_alternate:
-                return  # Image exists and not marked for replacement
-        
-        for attempt in range(3):
+        self.metrics.count("searches", source="network")
+        results = [{"image": r["image"]} for r in self.search_provider(query) if r.get("image")]
+        self.search_cache.put_search(query, results)
+        return results
+    
+    def download_candidate(self, url):
+        """Candidate image from the cache or the network, validated before the full decode;
+        returns the downloaded bytes and a reduced-size decode for hashing and scoring.
+        Only bodies that decode are cached as downloads"""
+        cached = self.search_cache.get_download(url, allow_stale=self.offline)
+        if cached is not None:
+            data, rejected = cached
+            self.metrics.count("downloads", source="cache")
+            if rejected:
+                raise CandidateRejected(rejected)
+            buffer = BytesIO(data)
+            self.check_image_size(self.probe_image_size(buffer))
+        elif self.offline:
+            raise CandidateRejected("Offline – nicht im Cache")
+        else:
+            self.metrics.count("downloads", source="network")
             try:
-                with DDGS() as ddgs:
-                    results = list(ddgs.images(query + " Fisch", max_results=10))
-                    random.shuffle(results)  # Shuffle for variety
-                    
-                    for r in results:
-                        try:
-                            img_data = requests.get(r["image"], timeout=10).content
-                            img = Image.open(BytesIO(img_data)).convert("RGB")
-                            
-                            # Quality check: minimum size requirement
-                            if img.width < 500 or img.height < 300:
-                                continue
-                            
-                            # Skip identical images
-                            if existing_hash and self.image_hash(img) == existing_hash:
-                                print(f"{query}: Identisches Bild – übersprungen")
-                                continue
-                            
-                            # Skip very similar images
-                            if existing_img:
-                                mse = self.image_diff(img, existing_img)
-                                if mse < 10:
-                                    print(f"{query}: Zu ähnlich (MSE={mse:.2f}) – übersprungen")
-                                    continue
-                            
-                            img.save(path)
-                            print(f"✅ {query}: Neues Bild gespeichert")
-                            return
-                        except Exception:
-                            continue
+                with self.metrics.span("http"):
+                    buffer = self.stream_candidate(url)
+            except CandidateRejected as e:
+                self.search_cache.put_rejection(url, str(e))
+                raise
+        
+        # Only candidates that passed the header checks get fully decoded
+        data = buffer.getvalue()
+        img = self.decode_candidate(url, data)
+        if cached is None:
+            self.search_cache.put_download(url, data)
+        return data, img
+    
+    def decode_candidate(self, url, data):
+        """Decode candidate bytes at about twice the analysis size (the dHash and scoring need no more);
+        truncated or corrupt bodies are cached as rejections"""
+        analysis_size = (QUALITY_ANALYSIS_SIZE[0] * 2, QUALITY_ANALYSIS_SIZE[1] * 2)
+        try:
+            with self.metrics.span("decode"), Image.open(BytesIO(data)) as img:
+                img.draft("RGB", analysis_size)  # JPEG: decode at a reduced DCT scale
+                img = img.convert("RGB")  # decodes every byte, so truncation still surfaces here
+            img.thumbnail(analysis_size)
+            return img
+        except Exception as e:  # OSError (truncated), UnidentifiedImageError, DecompressionBombError
+            reason = f"Nicht dekodierbar ({type(e).__name__}: {e})"
+            self.search_cache.put_rejection(url, reason)
+            raise CandidateRejected(reason) from e
+    
+    def check_image_size(self, size):
+        """Reject unidentifiable images and images below the minimum size"""
+        if size is None:
+            raise CandidateRejected("Unbekanntes Bildformat")
+        width, height = size
+        if width < MIN_IMAGE_WIDTH or height < MIN_IMAGE_HEIGHT:
+            raise CandidateRejected(f"Zu klein ({width}x{height})")
+    
+    def stream_candidate(self, url):
+        """Stream a candidate image, aborting as soon as format, size or byte limits fail"""
+        with self.metrics.span("rate_limit", key="host"):
+            self.host_limiter.wait(urlparse(url).netloc)
+        buffer = BytesIO()
+        try:
+            return self._stream_into(url, buffer)
+        finally:
+            self.metrics.count("bytes_downloaded", buffer.tell())
+    
+    def _stream_into(self, url, buffer):
+        """Body of stream_candidate; buffer is passed in so partial downloads are counted too"""
+        with self.session.get(url, timeout=10, stream=True) as response:
+            # Client errors answer the same way next time; server errors, timeouts and rate limits may be transient
+            if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                raise CandidateRejected(f"HTTP {response.status_code}")
+            response.raise_for_status()
+            
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if content_type and not (content_type.startswith("image/") or content_type == "application/octet-stream"):
+                raise CandidateRejected(f"Kein Bild ({content_type})")
+            
+            content_length = int(response.headers.get("Content-Length") or 0)
+            if content_length > MAX_IMAGE_BYTES:
+                raise CandidateRejected(f"Zu groß ({content_length} Bytes)")
+            
+            size = None
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                buffer.write(chunk)
+                if buffer.tell() > MAX_IMAGE_BYTES:
+                    raise CandidateRejected(f"Zu groß (> {MAX_IMAGE_BYTES} Bytes)")
                 
-                raise Exception("Kein ausreichendes Bild gefunden.")
-            except Exception as e:
-                print(f"{query}: Fehler – Versuch {attempt+1}/3 – {e}")
-                time.sleep(10 * (attempt + 1))
+                if size is None:
+                    size = self.probe_image_size(buffer)
+                    if size is None:
+                        if buffer.tell() > MAX_HEADER_BYTES:
+                            raise CandidateRejected("Unbekanntes Bildformat")
+                        continue
+                    
+                    # Quality check: minimum size requirement, decided from the header alone
+                    self.check_image_size(size)
+        
+        self.check_image_size(size)
+        return buffer
+    
+    def probe_image_size(self, buffer):
+        """Return (width, height) from the bytes received so far, or None if not yet identifiable"""
+        position = buffer.tell()
+        try:
+            buffer.seek(0)
+            with Image.open(buffer) as img:  # lazy: parses the header only
+                return img.size
+        except Exception:
+            return None
+        finally:
+            buffer.seek(position)
+    
+    def download_candidates(self, results, errors=None):
+        """Fetch all candidates of a search in parallel, yielding (url, bytes, reduced image) in result order;
+        transient transport errors (connection errors, timeouts, 5xx responses) are appended to errors"""
+        pool = ThreadPoolExecutor(max_workers=self.candidate_workers)
+        try:
+            futures = [(r["image"], pool.submit(self.download_candidate, r["image"])) for r in results]
+            for url, future in futures:
+                try:
+                    data, img = future.result()
+                except CandidateRejected as e:
+                    self.metrics.count("candidates_rejected", reason=e.reason)
+                    continue
+                except Exception as e:
+                    self.metrics.count("candidates_rejected", reason=type(e).__name__)
+                    if errors is not None and isinstance(e, requests.RequestException):
+                        errors.append((url, e))
+                    continue
+                self.metrics.count("candidates_downloaded")
+                yield url, data, img
+        finally:
+            # Only matters when the caller abandons the iteration early (e.g. on an error)
+            pool.shutdown(wait=False, cancel_futures=True)
+    
+    def build_inputs(self, kind, fish_data, records_hash=None):
+        """Content hashes of everything an output depends on"""
+        if records_hash is None:
+            records = hashlib.sha256()
+            for _ in hash_records(fish_data, records):
+                pass
+            records_hash = records.hexdigest()
+        inputs = {"version": GENERATOR_VERSION, "format": kind, "records": records_hash}
+        
+        if kind == "pdf":
+            inputs["layout"] = hashlib.sha256(json.dumps(self.pdf_layout, sort_keys=True).encode()).hexdigest()
+        if kind in ("pdf", "apkg"):
+            # Asset hashes are content hashes; missing/flagged state is an input too,
+            # so placeholders get replaced once images arrive
+            current = self.store.current(entry.question for entry in fish_data)
+            images = hashlib.sha256()
+            for entry in fish_data:
+                row = current.get(entry.question)
+                state = row["hash"] if row else "missing"
+                if row and row["poor_quality"]:
+                    state += ":flagged"
+                images.update(f"{entry.question}\0{state}\0".encode("utf-8"))
+            inputs["images"] = images.hexdigest()
+        return inputs
+    
+    def output_is_current(self, filename, inputs):
+        """True if the output exists and was built from exactly these inputs"""
+        output_path = f"{self.output_dir}/{filename}"
+        manifest_path = f"{self.manifest_dir}/{filename}.json"
+        if not (os.path.exists(output_path) and os.path.exists(manifest_path)):
+            return False
+        try:
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if manifest.get("inputs") != inputs:
+            changed = sorted(key for key in inputs if manifest.get("inputs", {}).get(key) != inputs[key])
+            print(f"🔁 {output_path}: geändert ({', '.join(changed)}) – wird neu erstellt")
+            return False
+        print(f"⏭️ {output_path}: unverändert – übersprungen")
+        return True
+    
+    def record_output(self, filename, inputs):
+        """Write the manifest of a freshly built output"""
+        manifest = {"inputs": inputs, "built_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        write_json_atomic(f"{self.manifest_dir}/{filename}.json", manifest)
+    
+    def card_image(self, asset_hash, img_path):
+        """Card-sized derivative of an image: cropped to the slot aspect ratio, resized and recompressed"""
+        layout = self.pdf_layout
+        slot_w = layout["card_w"] - 2 * layout["padding"]
+        slot_h = layout["card_h"] - 2 * layout["padding"]
+        target_w = round(slot_w / 25.4 * layout["image_dpi"])
+        target_h = round(slot_h / 25.4 * layout["image_dpi"])
+        
+        # Keyed by source content, target size and quality, so every selection reuses it
+        derivative_path = f"{self.derivatives_dir}/{asset_hash[:32]}_{target_w}x{target_h}_q{layout['jpeg_quality']}.jpg"
+        if os.path.exists(derivative_path):
+            return derivative_path
+        
+        os.makedirs(self.derivatives_dir, exist_ok=True)
+        with Image.open(img_path) as img:
+            img.draft("RGB", (target_w, target_h))  # JPEG: decode directly at a reduced scale
+            img = img.convert("RGB")
+            # Center crop to the slot aspect ratio
+            target_ratio = target_w / target_h
+            if img.width / img.height > target_ratio:
+                crop_w = round(img.height * target_ratio)
+                left = (img.width - crop_w) // 2
+                img = img.crop((left, 0, left + crop_w, img.height))
+            else:
+                crop_h = round(img.width / target_ratio)
+                top = (img.height - crop_h) // 2
+                img = img.crop((0, top, img.width, top + crop_h))
+            # Never upscale; fpdf scales the image into the slot anyway
+            if img.width > target_w:
+                img = img.resize((target_w, target_h), Image.LANCZOS)
+            
+            tmp_path = f"{derivative_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            img.save(tmp_path, "JPEG", quality=layout["jpeg_quality"], optimize=True)
+            os.replace(tmp_path, derivative_path)
+        return derivative_path
+    
+    def prepare_card_images(self, fish_data):
+        """Create card-sized derivatives for all available images in parallel; returns name -> path"""
+        current = self.store.current(entry.question for entry in fish_data)
+        
+        card_images = {}
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+            futures = {pool.submit(self.card_image, row["hash"], row["path"]): name for name, row in current.items()}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    card_images[name] = future.result()
+                except Exception as e:
+                    print(f"⚠️ {name}: Kartenbild konnte nicht erstellt werden – {e}")
+        return card_images
+    
+    def preflight_images(self, fish_data):
+        """Resolve the image requirements of a selection without touching the network"""
+        current = self.store.current(entry.question for entry in fish_data)
+        report = {"ok": [], "missing": [], "poor_quality": []}
+        for entry in fish_data:
+            row = current.get(entry.question)
+            if row is None:
+                report["missing"].append(entry.question)
+            elif row["poor_quality"]:
+                report["poor_quality"].append(entry.question)
+            else:
+                report["ok"].append(entry.question)
         
-        print(f"⚠️ {query}: Kein neues Bild gefunden.")
+        print(f"🔎 Bilder: {len(report['ok'])} vorhanden, {len(report['missing'])} fehlen, "
+              f"{len(report['poor_quality'])} in der Qualitätskontrolle")
+        for key, label in (("missing", "Fehlend"), ("poor_quality", "Qualitätskontrolle")):
+            names = report[key]
+            if names:
+                more = f" … und {len(names) - 20} weitere" if len(names) > 20 else ""
+                print(f"  {label}: {', '.join(names[:20])}{more}")
+        return report
     
-    def generate_pdf(self, fish_data=None, filename="fish_flashcards.pdf"):
-        """Generate PDF flashcards"""
+    def fetch_missing_images(self, report):
+        """Download everything a preflight report lists as missing or flagged"""
+        names = set(report["missing"]) | set(report["poor_quality"])
+        if not names:
+            return
+        self.download_images_for_fish([record for record in self.fish_data if record.question in names])
+    
+    def generate_pdf(self, fish_data=None, filename="fish_flashcards.pdf", force=False, fetch=True):
+        """Generate PDF flashcards; with fetch=False rendering never touches the network"""
         if fish_data is None:
             fish_data = self.fish_data
         
+        # Preflight: resolve images before layout, so rendering itself is purely offline
+        with self.metrics.span("preflight"):
+            report = self.preflight_images(fish_data)
+        if fetch and (report["missing"] or report["poor_quality"]):
+            self.fetch_missing_images(report)
+            self.preflight_images(fish_data)  # reports what is still missing
+        
+        inputs = self.build_inputs("pdf", fish_data)
+        if not force and self.output_is_current(filename, inputs):
+            return False
+        
         print(f"Generiere PDF mit {len(fish_data)} Fischen...")
         
-        # Load poor quality list
-        poor_quality_list = self.load_poor_quality_list()
-        replaced = []
+        output_path = self.output_file(filename)
+        workers = self.pdf_workers or os.cpu_count() or 1
+        pages = None
+        if workers > 1 and len(fish_data) >= self.pdf_shard_min_cards:
+            pages = self.layout_pdf_sharded(fish_data, output_path, workers)
+        if pages is None:
+            pdf = self.layout_pdf(fish_data)
+            
+            # Save PDF
+            with self.metrics.span("pdf_write"):
+                pdf.output(output_path)
+            pages = pdf.pages_count
+        self.metrics.count("pages", pages, format="pdf")
+        self.metrics.count("records_exported", len(fish_data), format="pdf")
+        print(f"✅ PDF erstellt: {output_path}")
+        
+        self.record_output(filename, inputs)
+        return True
+    
+    def layout_pdf(self, fish_data, card_images=None, charset=None):
+        """Lay out flashcards (image page + mirrored text page per 8 cards); returns the FPDF document"""
+        from fpdf import FPDF
         
         # PDF setup
+        layout = self.pdf_layout
         pdf = FPDF("P", "mm", "A4")
         pdf.set_auto_page_break(False)
-        pdf.add_font("SF", "", "/System/Library/Fonts/Supplemental/Arial Unicode.ttf")
-        pdf.set_font("SF", size=14)
+        pdf.add_font("SF", "", layout["font_path"])
+        pdf.set_font("SF", size=layout["font_size"])
+        if charset:
+            # Picking all glyphs up front in a fixed order gives every shard the identical font subset.
+            # subset.pick is fpdf2 internals (verified against the pinned fpdf2==2.8.3); if it changes,
+            # layout_pdf_sharded detects the duplicate fonts after the merge and falls back to one process
+            for char in charset:
+                pdf.current_font.subset.pick(ord(char))
         
-        card_w, card_h = 90, 60
-        margin_x, margin_y = 10, 10
+        card_w, card_h = layout["card_w"], layout["card_h"]
+        margin_x, margin_y = layout["margin_x"], layout["margin_y"]
+        gap, pad = layout["gap"], layout["padding"]
+        
+        # Embed card-sized derivatives instead of the full-size originals
+        if card_images is None:
+            with self.metrics.span("card_images"):
+                card_images = self.prepare_card_images(fish_data)
         
         # Generate flashcards
         for i in range(0, len(fish_data), 8):
             batch = fish_data[i:i+8]
             
             # Front side (images)
-            pdf.add_page()
-            for idx, entry in enumerate(batch):
-                row, col = divmod(idx, 2)
-                x = margin_x + col * (card_w + 10)
-                y = margin_y + row * (card_h + 10)
-                
-                img_path = f"{self.images_dir}/{entry['question']}.jpg"
-                force_alt = entry["question"] in poor_quality_list
-                
-                self.fetch_image(entry["question"], img_path, force_alternate=force_alt)
-                
-                if force_alt and os.path.exists(img_path):
-                    replaced.append(entry["question"])
-                
-                if os.path.exists(img_path):
-                    pdf.image(img_path, x+2, y+2, w=card_w-4, h=card_h-4)
-                
-                pdf.rect(x, y, card_w, card_h)
+            with self.metrics.span("pdf_page", side="front"):
+                pdf.add_page()
+                for idx, entry in enumerate(batch):
+                    row, col = divmod(idx, 2)
+                    x = margin_x + col * (card_w + gap)
+                    y = margin_y + row * (card_h + gap)
+                    
+                    if entry.question in card_images:
+                        pdf.image(card_images[entry.question], x+pad, y+pad, w=card_w-2*pad, h=card_h-2*pad)
+                    else:
+                        # Placeholder for images that are still missing
+                        pdf.set_fill_color(235)
+                        pdf.rect(x+pad, y+pad, card_w-2*pad, card_h-2*pad, style="F")
+                        pdf.set_xy(x+pad, y+pad)
+                        pdf.cell(card_w-2*pad, card_h-2*pad, "Kein Bild", align="C")
+                    
+                    pdf.rect(x, y, card_w, card_h)
             
             # Back side (text, mirrored for double-sided printing)
-            pdf.add_page()
-            for idx, entry in enumerate(batch):
-                row, col = divmod(idx, 2)
-                col = 1 - col  # Mirror columns for double-sided printing
-                x = margin_x + col * (card_w + 10)
-                y = margin_y + row * (card_h + 10)
-                
-                pdf.set_xy(x + 2, y + 2)
-                pdf.multi_cell(card_w - 4, 7, f"{entry['question']}\n\n{entry['answer']}")
-                pdf.rect(x, y, card_w, card_h)
+            with self.metrics.span("pdf_page", side="back"):
+                pdf.add_page()
+                for idx, entry in enumerate(batch):
+                    row, col = divmod(idx, 2)
+                    col = 1 - col  # Mirror columns for double-sided printing
+                    x = margin_x + col * (card_w + gap)
+                    y = margin_y + row * (card_h + gap)
+                    
+                    pdf.set_xy(x + pad, y + pad)
+                    pdf.multi_cell(card_w - 2*pad, layout["line_height"], f"{entry.question}\n\n{entry.answer}")
+                    pdf.rect(x, y, card_w, card_h)
         
-        # Save PDF
-        output_path = f"{self.output_dir}/{filename}"
-        pdf.output(output_path)
-        print(f"✅ PDF erstellt: {output_path}")
+        return pdf
+    
+    def layout_pdf_sharded(self, fish_data, output_path, workers):
+        """Lay out runs of 8-card page pairs in a process pool and merge them in duplex order;
+        returns the page count, or None (nothing written) if the shards' fonts could not be merged.
+        The shards share one font subset, so the merge keeps a single copy of the font and of every image"""
+        from concurrent.futures import ProcessPoolExecutor  # multiprocessing is only needed here
+        import pymupdf
+        
+        with self.metrics.span("card_images"):
+            card_images = self.prepare_card_images(fish_data)
+        charset = sorted({char for entry in fish_data for char in entry.question + entry.answer + "Kein Bild"
+                          if char.isprintable()})
+        
+        # Shards are whole page pairs, so concatenating them keeps fronts and backs aligned
+        pairs = -(-len(fish_data) // 8)
+        per_shard = 8 * -(-pairs // workers)
+        shards = [fish_data[i:i + per_shard] for i in range(0, len(fish_data), per_shard)]
+        shard_images = [{entry.question: card_images[entry.question] for entry in shard if entry.question in card_images}
+                        for shard in shards]
+        trace = self.metrics.events is not None
+        
+        merged = pymupdf.open()
+        with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+            results = pool.map(render_pdf_shard, itertools.repeat(self.pdf_layout), shards, shard_images,
+                               itertools.repeat(charset), itertools.repeat(trace))
+            for data, snapshot in results:
+                self.metrics.merge(snapshot)
+                with pymupdf.open("pdf", data) as shard:
+                    merged.insert_pdf(shard)
+        
+        # garbage=4 collapses the identical font and image objects the shards each carry
+        with self.metrics.span("pdf_write"):
+            data = merged.tobytes(garbage=4, deflate=True)
+            pages = merged.page_count
+            merged.close()
+            with pymupdf.open("pdf", data) as result:
+                fonts = sum(1 for xref in range(1, result.xref_length())
+                            if result.xref_get_key(xref, "Type") == ("name", "/FontDescriptor"))
+            if fonts > 1:
+                print(f"⚠️ Schrift {fonts}-mal eingebettet – PDF wird ohne Aufteilung erstellt")
+                return None
+            with open(output_path, "wb") as f:
+                f.write(data)
+        return pages
+    
+    def render_card_png(self, record, side="front"):
+        """One card as PNG at the PDF image resolution: the image (front) or the text (back)"""
+        from PIL import ImageDraw, ImageFont
+        
+        layout = self.pdf_layout
+        px = layout["image_dpi"] / 25.4  # pixels per mm
+        card_w, card_h = round(layout["card_w"] * px), round(layout["card_h"] * px)
+        pad = round(layout["padding"] * px)
+        font_px = round(layout["font_size"] / 72 * layout["image_dpi"])
+        try:
+            font = ImageFont.truetype(layout["font_path"], font_px)
+        except OSError:
+            font = ImageFont.load_default(font_px)
+        
+        card = Image.new("RGB", (card_w, card_h), "white")
+        draw = ImageDraw.Draw(card)
+        slot = (pad, pad, card_w - pad, card_h - pad)
+        if side == "front":
+            row = self.store.current([record.question]).get(record.question)
+            if row:
+                with Image.open(self.card_image(row["hash"], row["path"])) as img:
+                    card.paste(img.convert("RGB").resize((slot[2] - slot[0], slot[3] - slot[1])), slot[:2])
+            else:
+                # Placeholder for images that are still missing
+                draw.rectangle(slot, fill=(235, 235, 235))
+                draw.text((card_w / 2, card_h / 2), "Kein Bild", fill="black", font=font, anchor="mm")
+        else:
+            # Greedy word wrap of "name, blank line, answer" like multi_cell in the PDF
+            lines = []
+            for paragraph in f"{record.question}\n\n{record.answer}".split("\n"):
+                line = ""
+                for word in paragraph.split(" "):
+                    candidate = f"{line} {word}" if line else word
+                    if line and draw.textlength(candidate, font=font) > slot[2] - slot[0]:
+                        lines.append(line)
+                        candidate = word
+                    line = candidate
+                lines.append(line)
+            line_h = layout["line_height"] * px
+            for i, line in enumerate(lines):
+                draw.text((slot[0], slot[1] + i * line_h), line, fill="black", font=font)
+        draw.rectangle((0, 0, card_w - 1, card_h - 1), outline="black", width=max(1, round(0.2 * px)))
         
-        # Clean up poor quality list
-        if replaced:
-            updated_list = [name for name in poor_quality_list if name not in replaced]
-            self.save_poor_quality_list(updated_list)
-            print(f"🧽 Qualitätskontrolle bereinigt: {', '.join(replaced)}")
-    
-    def normalize_schonzeit(self, text):
-        """Normalize German date format for Schonzeit"""
-        match = re.search(r"(\d{2}\.\d{2})[–-](\d{2}\.\d{2})", text)
-        if match:
-            return f"{match.group(1)} bis {match.group(2)}"
-        return text.strip().rstrip(".")
-    
-    def generate_csv(self, fish_data=None, filename="fish_data.csv"):
-        """Generate CSV for import into flashcard systems"""
+        buffer = BytesIO()
+        card.save(buffer, "PNG")
+        return buffer.getvalue()
+    
+    def begin_export(self, kind, label, fish_data, filename, force):
+        """Manifest check before an export; returns (records to write, running records hash) or None if current.
+        Lists are checked up front; streams (any other iterable) are hashed while they are written"""
+        if isinstance(fish_data, list):
+            if not force and self.output_is_current(filename, self.build_inputs(kind, fish_data)):
+                return None
+            print(f"Generiere {label} mit {len(fish_data)} Fischen...")
+        else:
+            print(f"Generiere {label} aus Datenstrom...")
+        digest = hashlib.sha256()
+        return hash_records(fish_data, digest), digest
+    
+    @contextlib.contextmanager
+    def export_file(self, kind, filename, newline=None):
+        """Write an export through a temporary file, so a half-written stream never looks like a finished output"""
+        tmp_path = f"{self.output_file(filename)}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8", newline=newline) as f, \
+                    self.metrics.span("export_write", format=kind):
+                yield f
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, f"{self.output_dir}/{filename}")
+    
+    def finish_export(self, kind, filename, digest, count):
+        """Record the manifest of a completely written export; returns its path"""
+        self.metrics.count("records_exported", count, format=kind)
+        self.record_output(filename, self.build_inputs(kind, None, digest.hexdigest()))
+        return f"{self.output_dir}/{filename}"
+    
+    def generate_csv(self, fish_data=None, filename="fish_data.csv", force=False):
+        """Generate CSV for import into flashcard systems; fish_data may be a list or a record stream"""
         if fish_data is None:
             fish_data = self.fish_data
         
-        print(f"Generiere CSV mit {len(fish_data)} Fischen...")
+        export = self.begin_export("csv", "CSV", fish_data, filename, force)
+        if export is None:
+            return False
+        records, digest = export
         
-        lines = []
+        with self.export_file("csv", filename, newline="") as f:
+            count = self.write_csv(f, records)
         
-        for entry in fish_data:
-            name = entry["question"]
-            answer = entry["answer"]
-            schonzeit = ""
-            mindestmass = ""
-            fallback = ""
-            
-            if "Ganzjährig geschont" in answer:
-                fallback = "Ganzjährig geschont"
-            
-            if "Schonzeit:" in answer:
-                parts = answer.split("Schonzeit:")
-                rest = parts[1].strip()
-                if "," in rest:
-                    schonzeit, _ = rest.split(",", 1)
-                else:
-                    schonzeit = rest.strip()
-                schonzeit = self.normalize_schonzeit(schonzeit)
-            
-            if "Mindestmaß:" in answer:
-                parts = answer.split("Mindestmaß:")
-                rest = parts[1].strip()
-                if "," in rest:
-                    mindestmass, _ = rest.split(",", 1)
-                else:
-                    mindestmass = rest.strip()
+        output_path = self.finish_export("csv", filename, digest, count)
+        print(f"✅ CSV erstellt: {output_path}")
+        return True
+    
+    def write_csv(self, f, records):
+        """Write CSV rows as they are produced, quoted where needed; returns the number of rows"""
+        count = 0
+        writer = csv.writer(f, lineterminator="\n")
+        for entry in records:
+            schonzeit = entry.schonzeit
+            mindestmass = entry.mindestmass
+            fallback = YEAR_ROUND_MARKER if entry.year_round else ""
             
             result = ""
             if schonzeit:
@@ -248,82 +1832,319 @@ class FishGenerator:
             if mindestmass:
                 if result:
                     result += "<br/>"
-                result += f"Mindestmaß: {mindestmass.strip()}"
+                result += f"Mindestmaß: {mindestmass}"
             if not result:
                 result = fallback or "Keine Schonzeit oder Mindestmaß angegeben"
             
-            line = f"{name},{result.strip()}"
-            lines.append(line)
-        
-        output_path = f"{self.output_dir}/{filename}"
-        with open(output_path, "w", encoding="utf-8") as f:
-            for line in lines:
-                f.write(line + "\n")
-        
-        print(f"✅ CSV erstellt: {output_path}")
+            writer.writerow([entry.question, result.strip()])
+            count += 1
+        return count
     
-    def generate_repetico_json(self, fish_data=None, filename="repetico_export.json"):
-        """Generate JSON format for Repetico flashcard system"""
+    def generate_repetico_json(self, fish_data=None, filename="repetico_export.json", force=False):
+        """Generate JSON format for Repetico flashcard system; fish_data may be a list or a record stream"""
         if fish_data is None:
             fish_data = self.fish_data
         
-        print(f"Generiere Repetico JSON mit {len(fish_data)} Fischen...")
+        export = self.begin_export("json", "Repetico JSON", fish_data, filename, force)
+        if export is None:
+            return False
+        records, digest = export
         
-        repetico_data = []
-        for entry in fish_data:
+        with self.export_file("json", filename) as f:
+            count = self.write_repetico_json(f, records)
+        
+        output_path = self.finish_export("json", filename, digest, count)
+        print(f"✅ Repetico JSON erstellt: {output_path}")
+        return True
+    
+    def write_repetico_json(self, f, records):
+        """Write the Repetico JSON array one entry at a time (same bytes as json.dump(..., indent=2))"""
+        count = 0
+        f.write("[")
+        for entry in records:
             # Convert newlines to proper format for Repetico
-            answer = entry["answer"].replace(", ", "\n")
             repetico_entry = {
-                "question": entry["question"],
-                "answer": answer
+                "question": entry.question,
+                "answer": entry.answer.replace(", ", "\n")
             }
-            repetico_data.append(repetico_entry)
+            f.write(",\n  " if count else "\n  ")
+            f.write(json.dumps(repetico_entry, ensure_ascii=False, indent=2).replace("\n", "\n  "))
+            count += 1
+        f.write("\n]" if count else "]")
+        return count
+    
+    def generate_apkg(self, fish_data=None, filename="fish_flashcards.apkg", force=False, fetch=True,
+                      deck_name=None, card_images=False):
+        """Generate an Anki package (image on the front, name and rules on the back).
+        Images are copied into the zip as stored, once per content hash; with card_images=True
+        the card-sized derivatives of the PDF are packed instead of the originals"""
+        if fish_data is None:
+            fish_data = self.fish_data
+        deck_name = deck_name or f"Fischereischein Bayern::{filename.removesuffix('.apkg').removesuffix('_anki')}"
         
-        output_path = f"{self.output_dir}/{filename}"
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(repetico_data, f, ensure_ascii=False, indent=2)
+        report = self.preflight_images(fish_data)
+        if fetch and (report["missing"] or report["poor_quality"]):
+            self.fetch_missing_images(report)
         
-        print(f"✅ Repetico JSON erstellt: {output_path}")
+        inputs = self.build_inputs("apkg", fish_data)
+        inputs["deck"] = deck_name
+        if card_images:
+            inputs["layout"] = hashlib.sha256(json.dumps(self.pdf_layout, sort_keys=True).encode()).hexdigest()
+        if not force and self.output_is_current(filename, inputs):
+            return False
+        
+        print(f"Generiere Anki-Paket mit {len(fish_data)} Fischen...")
+        
+        current = self.store.current(entry.question for entry in fish_data)
+        derivatives = self.prepare_card_images(fish_data) if card_images else {}
+        media = {}  # media file name (content hash based) -> source path
+        
+        now = time.time()
+        mod = int(now)
+        base_id = int(now * 1000)
+        deck_id = anki_id(deck_name)
+        
+        def notes():
+            for i, entry in enumerate(fish_data):
+                image = ""
+                row = current.get(entry.question)
+                if row:
+                    path = derivatives.get(entry.question, row["path"])
+                    media_name = os.path.basename(path)
+                    media.setdefault(media_name, path)
+                    image = f'<img src="{media_name}">'
+                answer = "<br>".join(html.escape(part) for part in entry.answer.split(", "))
+                fields = "\x1f".join([html.escape(entry.question), image, answer])
+                yield (base_id + i, str(anki_id(f"fish:{entry.question}")), ANKI_MODEL_ID, mod, -1, "",
+                       fields, entry.question, anki_checksum(entry.question), 0, "")
+        
+        output_path = self.output_file(filename)
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        try:
+            with tempfile.TemporaryDirectory() as work_dir, self.metrics.span("export_write", format="apkg"):
+                # Collection on disk, notes inserted as they are produced
+                db_path = f"{work_dir}/collection.anki2"
+                db = sqlite3.connect(db_path)
+                try:
+                    db.executescript(ANKI_SCHEMA)
+                    col = anki_collection(deck_id, deck_name, now)
+                    db.execute("INSERT INTO col VALUES (1, ?, ?, ?, 11, 0, 0, 0, ?, ?, ?, ?, '{}')",
+                               (mod - mod % 86400, base_id, base_id, json.dumps(col["conf"]),
+                                json.dumps(col["models"]), json.dumps(col["decks"]), json.dumps(col["dconf"])))
+                    db.executemany("INSERT INTO notes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", notes())
+                    # One new card per note, in dataset order
+                    db.execute("INSERT INTO cards SELECT id, id, ?, 0, mod, -1, 0, 0, id - ?, "
+                               "0, 0, 0, 0, 0, 0, 0, 0, '' FROM notes", (deck_id, base_id - 1))
+                    db.commit()
+                finally:
+                    db.close()
+                
+                # Media are streamed from disk into the zip without decoding; JPEGs are stored, not deflated
+                media_map = {}
+                with zipfile.ZipFile(tmp_path, "w") as package:
+                    package.write(db_path, "collection.anki2", compress_type=zipfile.ZIP_DEFLATED)
+                    for index, (media_name, path) in enumerate(sorted(media.items())):
+                        package.write(path, str(index), compress_type=zipfile.ZIP_STORED)
+                        media_map[str(index)] = media_name
+                    package.writestr("media", json.dumps(media_map), compress_type=zipfile.ZIP_DEFLATED)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+        
+        self.metrics.count("records_exported", len(fish_data), format="apkg")
+        self.metrics.count("media_files", len(media_map), format="apkg")
+        self.record_output(filename, inputs)
+        print(f"✅ Anki-Paket erstellt: {output_path} ({len(fish_data)} Karten, {len(media_map)} Bilder)")
+        return True
+    
+    def generate_calendar_ics(self, fish_data=None, filename="schonzeiten.ics", year=None):
+        """Generate iCalendar file with yearly recurring Schonzeit events"""
+        if fish_data is None:
+            fish_data = self.fish_data
+        year = year or date.today().year
+        
+        print(f"Generiere Schonzeit-Kalender (ICS) mit {len(fish_data)} Fischen...")
+        
+        stamp = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//bayern-fische-schonzeiten//DE", "CALSCALE:GREGORIAN"]
+        for entry in fish_data:
+            for (start_month, start_day), (end_month, end_day) in self.calendar.closed_ranges(entry):
+                start = safe_date(year, start_month, start_day)
+                end_year = year if (end_month, end_day) >= (start_month, start_day) else year + 1
+                end = safe_date(end_year, end_month, end_day) + timedelta(days=1)  # DTEND is exclusive
+                lines += [
+                    "BEGIN:VEVENT",
+                    f"UID:{hashlib.sha1(f'{entry.question}-{start_month}-{start_day}'.encode()).hexdigest()}@schonzeiten",
+                    f"DTSTAMP:{stamp}",
+                    f"DTSTART;VALUE=DATE:{start:%Y%m%d}",
+                    f"DTEND;VALUE=DATE:{end:%Y%m%d}",
+                    "RRULE:FREQ=YEARLY",
+                    f"SUMMARY:Schonzeit {ics_escape(entry.question)}",
+                    f"DESCRIPTION:{ics_escape(entry.answer)}",
+                    "END:VEVENT",
+                ]
+        lines.append("END:VCALENDAR")
+        
+        output_path = self.output_file(filename)
+        with open(output_path, "w", encoding="utf-8", newline="") as f:
+            f.write("\r\n".join(ics_fold(line) for line in lines) + "\r\n")
+        
+        print(f"✅ Kalender erstellt: {output_path}")
+    
+    def generate_calendar_csv(self, fish_data=None, filename="schonzeiten_kalender.csv", year=None, region=None):
+        """Generate date x species matrix (1 = closed) for a whole year"""
+        if fish_data is None:
+            fish_data = self.fish_data
+        year = year or date.today().year
+        
+        print(f"Generiere Schonzeit-Matrix (CSV) für {year} mit {len(fish_data)} Fischen...")
+        
+        dates, matrix = self.calendar.year_matrix(year, region)
+        columns = [entry.id for entry in fish_data]
+        matrix = matrix[:, columns].astype(np.uint8)
+        
+        output_path = self.output_file(filename)
+        with open(output_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Datum"] + [entry.question for entry in fish_data])
+            for day, row in zip(dates.astype(str), matrix.tolist()):
+                writer.writerow([day] + row)
+        
+        print(f"✅ Kalender-Matrix erstellt: {output_path}")
+    
+    @property
+    def download_queue(self):
+        """Persistent download job queue, opened on first use"""
+        if self._download_queue is None:
+            self._download_queue = DownloadQueue(self.store_db, self.max_attempts, self.retry_backoff)
+        return self._download_queue
     
     def download_images_for_fish(self, fish_data, force_redownload=False):
-        """Download images for a list of fish, standalone from PDF generation"""
+        """Download images for a list of fish, standalone from PDF generation; resumes interrupted runs"""
         print(f"Lade Bilder für {len(fish_data)} Fische herunter...")
         
-        poor_quality_list = self.load_poor_quality_list()
-        replaced = []
+        queue = self.download_queue
+        resumed = queue.resume()
+        if resumed:
+            print(f"▶️ Unterbrochener Download wird fortgesetzt ({resumed} offene Aufträge)")
+        
+        poor_quality_list = set(self.load_poor_quality_list())
         downloaded = 0
         skipped = 0
+        failed = 0
         
+        current = self.store.current(entry.question for entry in fish_data)
+        requested = []
         for entry in fish_data:
-            fish_name = entry["question"]
-            img_path = f"{self.images_dir}/{fish_name}.jpg"
+            fish_name = entry.question
             
             # Determine if we should force alternate (better) image
             force_alt = fish_name in poor_quality_list or force_redownload
             
             # Check if image already exists and we're not forcing redownload
-            if os.path.exists(img_path) and not force_alt:
+            if fish_name in current and not force_alt:
                 print(f"⏭️ {fish_name}: Bild bereits vorhanden")
+                self.metrics.count("download_jobs", result="skipped")
                 skipped += 1
                 continue
             
-            print(f"🔄 Lade Bild für {fish_name}...")
-            self.fetch_image(fish_name, img_path, force_alternate=force_alt)
-            
-            # Track successful replacements for cleanup
-            if force_alt and os.path.exists(img_path) and fish_name in poor_quality_list:
-                replaced.append(fish_name)
-            
-            if os.path.exists(img_path):
-                downloaded += 1
+            queue.enqueue(fish_name, force_alt)
+            requested.append(fish_name)
+        
+        # Download several species at once; failed jobs are rescheduled in the queue
+        # instead of sleeping, so other species keep running in the meantime
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool, self.metrics.span("download_run"):
+            running = {}
+            while True:
+                for fish_name, force_alt in queue.claim_due(self.max_workers - len(running)):
+                    print(f"🔄 Lade Bild für {fish_name}...")
+                    future = pool.submit(self.fetch_image, fish_name, force_alternate=force_alt)
+                    running[future] = (fish_name, force_alt)
+                
+                next_due = queue.next_due()
+                if not running:
+                    if next_due is None:
+                        break
+                    # Nothing running: wait for the next retry to become due
+                    with self.metrics.span("retry_wait"):
+                        time.sleep(max(0.0, next_due - time.time()))
+                    continue
+                
+                # With a free slot, wake up when the next retry is due; with all slots busy only a
+                # finished download can change anything, so don't poll the queue in the meantime
+                timeout = None
+                if next_due is not None and len(running) < self.max_workers:
+                    timeout = max(0.0, next_due - time.time())
+                finished, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    fish_name, force_alt = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        # A rejection repeats identically from the cache; retry transport and search errors only
+                        delay = queue.fail(fish_name, str(e),
+                                           retry=not self.offline and not isinstance(e, CandidateRejected))
+                        if delay is None:
+                            failed += 1
+                            self.metrics.count("download_jobs", result="failed")
+                            print(f"⚠️ {fish_name}: Kein neues Bild gefunden – {e}")
+                        else:
+                            self.metrics.count("download_jobs", result="retry")
+                            self.metrics.count("retry_delay_seconds", delay)
+                            print(f"{fish_name}: Fehler – neuer Versuch in {delay:g}s – {e}")
+                        continue
+                    
+                    queue.complete(fish_name)
+                    self.metrics.count("download_jobs", result="downloaded")
+                    downloaded += 1
+                    # Checkpoint the quality flag right away, not at the end of the run
+                    if force_alt and fish_name in poor_quality_list:
+                        self.store.set_flag(fish_name, False)
+                        print(f"🧽 Qualitätskontrolle bereinigt: {fish_name}")
+        
+        queue.clear_finished_run()
+        # Offline runs rely on stale entries, so the cache is only pruned after online runs that used it
+        if not self.offline and self._search_cache is not None:
+            removed = self.search_cache.prune()
+            if removed:
+                print(f"🧹 Cache bereinigt: {removed} veraltete Downloads entfernt")
+        print(f"📊 Ergebnis: {downloaded} heruntergeladen, {skipped} übersprungen, {failed} fehlgeschlagen")
+        for row in queue.failed(requested):
+            attempts = f"{row['attempts']} Versuch" + ("e" if row["attempts"] != 1 else "")
+            print(f"  ❌ {row['name']} ({attempts}): {row['last_error']}")
+    
+    def score_library(self, threshold=QUALITY_FLAG_THRESHOLD, batch_size=256):
+        """Score every current image in one pass, store the scores and flag weak images"""
+        current = self.store.current()
+        print(f"Bewerte {len(current)} Bilder...")
+        
+        results = {}
+        names = sorted(current)
+        for start in range(0, len(names), batch_size):
+            batch_names = names[start:start + batch_size]
+            images, ratios = [], []
+            for name in batch_names:
+                with Image.open(current[name]["path"]) as img:
+                    ratios.append(img.width / img.height)
+                    img.draft("RGB", (QUALITY_ANALYSIS_SIZE[0] * 2, QUALITY_ANALYSIS_SIZE[1] * 2))
+                    images.append(img.convert("RGB"))
+            scores = score_images(images, ratios)["score"]
+            for name, score in zip(batch_names, scores):
+                results[name] = float(score)
+                self.store.set_quality(current[name]["hash"], float(score))
         
-        # Clean up poor quality list for successfully replaced images
-        if replaced:
-            updated_list = [name for name in poor_quality_list if name not in replaced]
-            self.save_poor_quality_list(updated_list)
-            print(f"🧽 Qualitätskontrolle bereinigt: {', '.join(replaced)}")
+        flagged = []
+        for name, score in sorted(results.items(), key=lambda item: item[1]):
+            if score < threshold and not current[name]["poor_quality"]:
+                self.store.set_flag(name, True, f"Qualitätswert {score:.2f}")
+                flagged.append(name)
         
-        print(f"📊 Ergebnis: {downloaded} heruntergeladen, {skipped} übersprungen")
+        if flagged:
+            print(f"🚩 Schwache Bilder markiert: {', '.join(flagged)}")
+        print(f"📊 Ergebnis: {len(results)} bewertet, {len(flagged)} neu markiert")
+        return results
     
     def download_all_images(self, force_redownload=False):
         """Download images for all fish in the dataset"""
@@ -339,7 +2160,7 @@ class FishGenerator:
         print(f"Lade {len(poor_quality_list)} Bilder aus der Qualitätskontrolle-Liste neu...")
         
         # Filter fish data to only include those in poor quality list
-        fish_to_redownload = [fish for fish in self.fish_data if fish["question"] in poor_quality_list]
+        fish_to_redownload = [fish for fish in self.fish_data if fish.question in poor_quality_list]
         
         if fish_to_redownload:
             self.download_images_for_fish(fish_to_redownload, force_redownload=True)
@@ -347,6 +2168,304 @@ class FishGenerator:
             print("⚠️ Keine passenden Fische in der Datenbank gefunden.")
 
 
+_worker_generator = None
+
+
+def _init_build_worker(dataset):
+    """Process pool initializer: one generator per worker around the shared parsed dataset"""
+    global _worker_generator
+    _worker_generator = FishGenerator(dataset=dataset)
+    _worker_generator.pdf_workers = 1  # the batch already runs one job per core
+
+
+def render_pdf_shard(layout, records, card_images, charset, trace=False):
+    """Process pool worker: lay out one shard of page pairs; returns the PDF bytes and the shard's metrics"""
+    generator = FishGenerator(metrics=Metrics(trace))
+    generator.pdf_layout = layout
+    pdf = generator.layout_pdf(records, card_images, charset)
+    return bytes(pdf.output()), generator.metrics.snapshot()
+
+
+def run_build_job(selection, fmt, force=False, trace=False):
+    """Build one selection x format in a worker; progress output goes to stderr, metrics go back with the job"""
+    _worker_generator.metrics = Metrics(trace)
+    method, pattern = FORMATS[fmt]
+    filename = pattern.format(selection=selection)
+    job = {"selection": selection, "format": fmt, "output": f"{_worker_generator.output_dir}/{filename}"}
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            options = {"force": force, "fetch": False} if fmt in IMAGE_FORMATS else {"force": force}
+            built = getattr(_worker_generator, method)(_worker_generator.select_fish(selection), filename, **options)
+        job["status"] = "built" if built else "skipped"
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = f"{type(e).__name__}: {e}"
+    job["seconds"] = round(time.perf_counter() - start, 4)
+    job["metrics"] = _worker_generator.metrics.snapshot()
+    return job
+
+
+def run_batch(selections=None, formats=None, workers=None, force=False, offline=False, metrics=None):
+    """Build every selection x format without interaction; returns a summary dict"""
+    from concurrent.futures import ProcessPoolExecutor  # multiprocessing is only needed here
+    
+    selections = selections or list(SELECTIONS)
+    formats = formats or list(FORMATS)
+    start = time.perf_counter()
+    
+    with contextlib.redirect_stdout(sys.stderr):
+        generator = FishGenerator(metrics=metrics)
+        # Fetch missing images up front; the parallel PDF/Anki jobs run offline
+        if set(formats) & set(IMAGE_FORMATS) and not offline:
+            needed = {record.id: record for selection in selections for record in generator.select_fish(selection)}
+            generator.fetch_missing_images(generator.preflight_images([needed[i] for i in sorted(needed)]))
+    
+    jobs = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_build_worker,
+                             initargs=(generator.dataset,)) as pool:
+        trace = generator.metrics.events is not None
+        futures = [pool.submit(run_build_job, selection, fmt, force, trace)
+                   for selection in selections for fmt in formats]
+        for future in futures:
+            job = future.result()
+            generator.metrics.merge(job.pop("metrics"))
+            jobs.append(job)
+    
+    return {
+        "generator_version": GENERATOR_VERSION,
+        "workers": workers or os.cpu_count(),
+        "wall_seconds": round(time.perf_counter() - start, 4),
+        "built": sum(job["status"] == "built" for job in jobs),
+        "skipped": sum(job["status"] == "skipped" for job in jobs),
+        "failed": sum(job["status"] == "failed" for job in jobs),
+        "jobs": jobs,
+    }
+
+
+def run_stream(path, selections=None, formats=None, force=False, metrics=None):
+    """Build CSV/JSON exports straight from a (JSON Lines) data file, one lazy pass per output;
+    memory stays flat regardless of the dataset size. Returns a summary dict like run_batch"""
+    selections = selections or list(SELECTIONS)
+    formats = formats or list(STREAM_FORMATS)
+    start = time.perf_counter()
+    
+    jobs = []
+    with contextlib.redirect_stdout(sys.stderr):
+        generator = FishGenerator(metrics=metrics)  # records come from the stream; the dataset is never loaded
+        for selection in selections:
+            for fmt in formats:
+                method, pattern = FORMATS[fmt]
+                filename = pattern.format(selection=selection)
+                job = {"selection": selection, "format": fmt, "output": f"{generator.output_dir}/{filename}"}
+                job_start = time.perf_counter()
+                try:
+                    records = filter_records(iter_records(path), SELECTIONS[selection])
+                    built = getattr(generator, method)(records, filename, force=force)
+                    job["status"] = "built" if built else "skipped"
+                except Exception as e:
+                    job["status"] = "failed"
+                    job["error"] = f"{type(e).__name__}: {e}"
+                job["seconds"] = round(time.perf_counter() - job_start, 4)
+                jobs.append(job)
+    
+    return {
+        "generator_version": GENERATOR_VERSION,
+        "stream": path,
+        "wall_seconds": round(time.perf_counter() - start, 4),
+        "built": sum(job["status"] == "built" for job in jobs),
+        "skipped": sum(job["status"] == "skipped" for job in jobs),
+        "failed": sum(job["status"] == "failed" for job in jobs),
+        "jobs": jobs,
+    }
+
+
+class RenderCache:
+    """Thread-safe LRU of rendered responses, bounded by the total size of the bodies"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()  # key -> (state, etag, content type, body)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        if len(entry[3]) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[3])
+            self._entries[key] = entry
+            self.size += len(entry[3])
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted[3])
+
+
+class CardService:
+    """On-demand cards, decks and calendar answers for the local HTTP server.
+    Responses are cached by request; the ETag is derived from the build inputs (records, images, layout),
+    so unchanged content is revalidated without rendering"""
+
+    ROUTES = ("/card/<name>.png?side=front|back", "/card/<name>.pdf", "/deck.pdf|.csv|.json?selection=&region=",
+              "/calendar?date=YYYY-MM-DD&region=")
+
+    def __init__(self, generator, cache_bytes=64 * 1024 * 1024):
+        self.generator = generator
+        self.cache = RenderCache(cache_bytes)
+        digest = hashlib.sha256()
+        for _ in hash_records(generator.fish_data, digest):
+            pass
+        self.dataset_hash = digest.hexdigest()
+
+    def route(self, path, params):
+        """(cache key, build-input kind, records, render function, content type) for a request"""
+        generator = self.generator
+        region = params.get("region") or None
+        if region is not None and region not in REGION_BITS:
+            raise ValueError(f"Unbekanntes Einzugsgebiet: {region}")
+        
+        if path.startswith("/card/"):
+            name, _, ext = path[len("/card/"):].rpartition(".")
+            record = generator.dataset.by_name.get(name)
+            if record is None:
+                raise LookupError(f"Unbekannter Fisch: {name}")
+            if ext == "png":
+                side = params.get("side", "front")
+                if side not in ("front", "back"):
+                    raise ValueError(f"Unbekannte Seite: {side}")
+                return (path, side), "pdf", [record], lambda: generator.render_card_png(record, side), "image/png"
+            if ext == "pdf":
+                return (path,), "pdf", [record], lambda: bytes(generator.layout_pdf([record]).output()), \
+                    "application/pdf"
+        
+        elif path.startswith("/deck."):
+            selection = params.get("selection", "alle_fische")
+            if selection not in SELECTIONS:
+                raise ValueError(f"Unbekannte Auswahl: {selection}")
+            records = generator.dataset.select(status=SELECTIONS[selection], region=region)
+            key = (path, selection, region)
+            ext = path[len("/deck."):]
+            if ext == "pdf":
+                return key, "pdf", records, lambda: bytes(generator.layout_pdf(records).output()), "application/pdf"
+            if ext in ("csv", "json"):
+                write = generator.write_csv if ext == "csv" else generator.write_repetico_json
+                
+                def render():
+                    buffer = StringIO(newline="")
+                    write(buffer, records)
+                    return buffer.getvalue().encode("utf-8")
+                
+                content_type = "text/csv; charset=utf-8" if ext == "csv" else "application/json; charset=utf-8"
+                return key, ext, records, render, content_type
+        
+        elif path == "/calendar":
+            try:
+                day = date.fromisoformat(params["date"]) if params.get("date") else date.today()
+            except ValueError:
+                raise ValueError(f"Ungültiges Datum: {params['date']}") from None
+            
+            def render():
+                closed = []
+                for record in generator.calendar.closed_on(day, region):
+                    opens = generator.calendar.season_opens(record, day)
+                    closed.append({"name": record.question, "year_round": record.year_round,
+                                   "opens": opens.isoformat() if opens else None})
+                return json.dumps({"date": day.isoformat(), "region": region, "closed": closed},
+                                  ensure_ascii=False).encode("utf-8")
+            
+            return (path, day.isoformat(), region), "calendar", generator.fish_data, render, \
+                "application/json; charset=utf-8"
+        
+        raise LookupError(f"Unbekannter Pfad: {path}")
+
+    def etag(self, key, kind, records):
+        inputs = self.generator.build_inputs(kind, records)
+        return '"' + hashlib.sha256(json.dumps([key, inputs]).encode()).hexdigest()[:32] + '"'
+
+    def respond(self, path, params, if_none_match=None):
+        """(status, headers, body) for a GET request"""
+        if path == "/":
+            body = json.dumps({"routes": self.ROUTES, "records": len(self.generator.fish_data)}, ensure_ascii=False)
+            return 200, {"Content-Type": "application/json; charset=utf-8"}, body.encode("utf-8")
+        try:
+            key, kind, records, render, content_type = self.route(path, params)
+        except LookupError as e:
+            return self.error(404, e)
+        except ValueError as e:
+            return self.error(400, e)
+        
+        # The state token is cheap to check; only when it moved is the ETag recomputed,
+        # and only when the ETag moved is the response rendered again
+        state = (self.dataset_hash, self.generator.store.revision())
+        entry = self.cache.get(key)
+        status = "hit"
+        if entry is None or entry[0] != state:
+            etag = self.etag(key, kind, records)
+            if entry is not None and entry[1] == etag:
+                entry = (state, etag, content_type, entry[3])
+            elif if_none_match == etag:
+                return 304, {"ETag": etag, "X-Cache": "revalidated"}, b""
+            else:
+                status = "miss"
+                with self.generator.metrics.span("serve_render", kind=kind):
+                    entry = (state, etag, content_type, render())
+            self.cache.put(key, entry)
+        self.generator.metrics.count("serve_requests", cache=status)
+        
+        headers = {"ETag": entry[1], "Cache-Control": "no-cache", "X-Cache": status}
+        if if_none_match == entry[1]:
+            return 304, headers, b""
+        headers["Content-Type"] = entry[2]
+        return 200, headers, entry[3]
+
+    def error(self, status, message):
+        body = json.dumps({"error": str(message).strip("'")}, ensure_ascii=False).encode("utf-8")
+        return status, {"Content-Type": "application/json; charset=utf-8"}, body
+
+
+def run_server(host="127.0.0.1", port=8765, cache_mb=64, metrics=None):
+    """Serve cards, decks and calendar queries over HTTP until interrupted"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    service = CardService(FishGenerator(metrics=metrics), cache_mb * 1024 * 1024)
+    
+    class CardRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            try:
+                status, headers, body = service.respond(unquote(url.path), params, self.headers.get("If-None-Match"))
+            except Exception as e:
+                status, headers, body = service.error(500, f"{type(e).__name__}: {e}")
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+        
+        do_HEAD = do_GET
+    
+    server = ThreadingHTTPServer((host, port), CardRequestHandler)
+    print(f"🌐 Server läuft auf http://{host}:{server.server_address[1]}/ (Beenden mit Strg+C)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServer beendet.")
+    finally:
+        server.server_close()
+
+
 def handle_image_downloads(generator):
     """Handle image download submenu"""
     while True:
@@ -355,9 +2474,10 @@ def handle_image_downloads(generator):
         print("2. Alle Bilder neu herunterladen (überschreibt vorhandene)")
         print("3. Nur schlechte Qualität ersetzen")
         print("4. Bilder für bestimmte Fischauswahl herunterladen")
+        print("5. Bildqualität bewerten (schwache Bilder markieren)")
         print("9. Zurück zum Hauptmenü")
         
-        choice = input("\nBitte wählen (1-4, 9): ").strip()
+        choice = input("\nBitte wählen (1-5, 9): ").strip()
         
         if choice == "9":
             break
@@ -376,6 +2496,9 @@ def handle_image_downloads(generator):
             generator.download_poor_quality_images()
         elif choice == "4":
             handle_selective_image_download(generator)
+        elif choice == "5":
+            print("\n🔎 Bewerte Bildqualität...")
+            generator.score_library()
         else:
             print("❌ Ungültige Auswahl. Bitte versuchen Sie es erneut.")
 
@@ -412,8 +2535,33 @@ def handle_selective_image_download(generator):
     generator.download_images_for_fish(selected_fish, force_redownload=force)
 
 
-def main():
-    generator = FishGenerator()
+def handle_schonzeit_query(generator):
+    """Ask for a date and Einzugsgebiet and list closed fish"""
+    text = input("\nDatum (TT.MM.JJJJ, leer = heute): ").strip()
+    try:
+        day = date.today() if not text else date(*reversed([int(part) for part in text.split(".")]))
+    except (ValueError, TypeError):
+        print("❌ Ungültiges Datum.")
+        return
+    
+    region = input("Einzugsgebiet (D/E/R/W, leer = alle): ").strip().upper() or None
+    if region and region not in REGION_CODES:
+        print("❌ Ungültiges Einzugsgebiet.")
+        return
+    
+    closed = generator.fish_closed_on(day, region)
+    area = f" im Einzugsgebiet {region}" if region else ""
+    print(f"\n📅 Am {day:%d.%m.%Y}{area} geschont: {len(closed)} Fische")
+    for record in closed:
+        if record.year_round:
+            print(f"  - {record.question} (ganzjährig)")
+        else:
+            opens = generator.season_opens(record.question, day)
+            print(f"  - {record.question} (wieder offen ab {opens:%d.%m.%Y})")
+
+
+def main(offline=False, metrics=None):
+    generator = FishGenerator(offline=offline, metrics=metrics)
     
     print("🐟 Bayerische Fischarten - Schonzeiten Generator")
     print("=" * 50)
@@ -423,9 +2571,10 @@ def main():
         print("\nHauptmenü:")
         print("1. Karteikarten/Dateien generieren")
         print("2. Fischbilder herunterladen")
+        print("3. Schonzeiten abfragen")
         print("0. Beenden")
         
-        main_choice = input("\nBitte wählen (0-2): ").strip()
+        main_choice = input("\nBitte wählen (0-3): ").strip()
         
         if main_choice == "0":
             print("Auf Wiedersehen!")
@@ -434,6 +2583,8 @@ def main():
             handle_content_generation(generator)
         elif main_choice == "2":
             handle_image_downloads(generator)
+        elif main_choice == "3":
+            handle_schonzeit_query(generator)
         else:
             print("❌ Ungültige Auswahl. Bitte versuchen Sie es erneut.")
 
@@ -478,9 +2629,11 @@ def handle_content_generation(generator):
         print("2. CSV für Repetico/Anki")
         print("3. JSON für Repetico")
         print("4. Alle Formate")
+        print("5. Schonzeit-Kalender (ICS + CSV-Matrix)")
+        print("6. Anki-Paket (.apkg) mit Bildern")
         print("9. Zurück zur Fischauswahl")
         
-        format_choice = input("\nBitte wählen (1-4, 9): ").strip()
+        format_choice = input("\nBitte wählen (1-6, 9): ").strip()
         
         if format_choice == "9":
             continue
@@ -509,9 +2662,126 @@ def handle_content_generation(generator):
             generator.generate_repetico_json(selected_fish, f"{suffix}_repetico.json")
             print("✅ Alle Formate wurden generiert!")
         
+        elif format_choice == "5":
+            generator.generate_calendar_ics(selected_fish, f"{suffix}_schonzeiten.ics")
+            generator.generate_calendar_csv(selected_fish, f"{suffix}_schonzeiten_kalender.csv")
+        
+        elif format_choice == "6":
+            generator.generate_apkg(selected_fish, f"{suffix}_anki.apkg")
+        
         else:
             print("❌ Ungültige Auswahl. Bitte versuchen Sie es erneut.")
 
 
+@contextlib.contextmanager
+def profiled(mode=None, output=None):
+    """Optional cProfile / tracemalloc hook around a whole run (main process only)"""
+    if mode == "cprofile":
+        import cProfile
+        import pstats
+        
+        output = output or "profile.pstats"
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(output)
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(25)
+            print(f"💾 Profil gespeichert: {output} (ansehen mit: python -m pstats {output})", file=sys.stderr)
+    elif mode == "tracemalloc":
+        import tracemalloc
+        
+        output = output or "tracemalloc.txt"
+        tracemalloc.start(25)
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(output, "w", encoding="utf-8") as f:
+                f.write(f"current: {current} bytes, peak: {peak} bytes\n\n")
+                for stat in snapshot.statistics("lineno")[:50]:
+                    f.write(f"{stat}\n")
+            print(f"💾 Speicherprofil gespeichert: {output} (Spitze {peak / 1024 / 1024:.1f} MB)", file=sys.stderr)
+    else:
+        yield
+
+
+def export_metrics(metrics, jsonl_path=None, prometheus_path=None):
+    """Write the collected metrics to the requested files and print the stage summary"""
+    if not (jsonl_path or prometheus_path):
+        return
+    if jsonl_path:
+        metrics.write_jsonl(jsonl_path)
+    if prometheus_path:
+        metrics.write_prometheus(prometheus_path)
+    metrics.report(file=sys.stderr)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bayerische Fischarten - Schonzeiten Generator")
+    parser.add_argument("--batch", action="store_true",
+                        help="alle Auswahlen x Formate ohne Menü erstellen, JSON-Zusammenfassung auf stdout")
+    parser.add_argument("--selections", default=",".join(SELECTIONS),
+                        help=f"kommagetrennt, Standard: {','.join(SELECTIONS)}")
+    parser.add_argument("--formats", help=f"kommagetrennt, Standard: {','.join(FORMATS)} "
+                                          f"(mit --stream: {','.join(STREAM_FORMATS)})")
+    parser.add_argument("--workers", type=int, default=None, help="Anzahl Prozesse (Standard: CPU-Kerne)")
+    parser.add_argument("--force", action="store_true", help="unveränderte Dateien trotzdem neu erstellen")
+    parser.add_argument("--offline", action="store_true",
+                        help="kein Netzwerk: nur gespeicherte Suchen/Downloads aus cache/ verwenden; "
+                             "im Batch-Modus erscheinen fehlende Bilder als Platzhalter")
+    parser.add_argument("--summary", help="Zusammenfassung zusätzlich in diese Datei schreiben")
+    parser.add_argument("--stream", metavar="DATEI",
+                        help="CSV/JSON direkt aus einer (JSON-Lines-)Datei erstellen, ohne den Datensatz "
+                             "komplett zu laden; Speicherbedarf unabhängig von der Größe")
+    parser.add_argument("--serve", action="store_true",
+                        help="lokalen HTTP-Server für Karten, Stapel und Schonzeit-Abfragen starten (nur vorhandene "
+                             "Bilder, keine Downloads)")
+    parser.add_argument("--host", default="127.0.0.1", help="Adresse für --serve (Standard: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Port für --serve (Standard: 8765)")
+    parser.add_argument("--cache-mb", type=int, default=64, help="Größe des Antwort-Caches für --serve in MB")
+    parser.add_argument("--metrics-jsonl", help="Zeiten je Phase und Zähler an diese JSON-Lines-Datei anhängen")
+    parser.add_argument("--metrics-prom", help="Zeiten je Phase und Zähler im Prometheus-Textformat schreiben")
+    parser.add_argument("--profile", choices=["cprofile", "tracemalloc"],
+                        help="Lauf profilieren (nur Hauptprozess; im Batch-Modus nicht die Worker)")
+    parser.add_argument("--profile-output", help="Datei für das Profil (Standard: profile.pstats / tracemalloc.txt)")
+    args = parser.parse_args(argv)
+    
+    args.selections = [name.strip() for name in args.selections.split(",") if name.strip()]
+    default_formats = STREAM_FORMATS if args.stream else FORMATS
+    args.formats = [name.strip() for name in (args.formats or ",".join(default_formats)).split(",") if name.strip()]
+    for name in args.selections:
+        if name not in SELECTIONS:
+            parser.error(f"unbekannte Auswahl: {name}")
+    for name in args.formats:
+        if name not in default_formats:
+            parser.error(f"unbekanntes Format: {name}" + (" (mit --stream nur csv, json)" if args.stream else ""))
+    return args
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    metrics = Metrics(trace=bool(args.metrics_jsonl))
+    exit_code = 0
+    try:
+        with profiled(args.profile, args.profile_output):
+            if args.serve:
+                run_server(args.host, args.port, args.cache_mb, metrics)
+            elif args.batch or args.stream:
+                if args.stream:
+                    summary = run_stream(args.stream, args.selections, args.formats, args.force, metrics)
+                else:
+                    summary = run_batch(args.selections, args.formats, args.workers, args.force, args.offline, metrics)
+                if args.summary:
+                    write_json_atomic(args.summary, summary)
+                print(json.dumps(summary, ensure_ascii=False))
+                exit_code = 1 if summary["failed"] else 0
+            else:
+                main(offline=args.offline, metrics=metrics)
+    finally:
+        export_metrics(metrics, args.metrics_jsonl, args.metrics_prom)
+    sys.exit(exit_code)
\ No newline at end of file